@@ -0,0 +1,83 @@
+"""
+Porovnání latence databázových backendů (DB_BACKEND=postgres / sqlite).
+
+Pro každý backend změří operace, které obslouží jeden request webu:
+registraci nového e-mailu (web_api), dohledání id podle tokenu bez cache
+a zápis jedné události (dynamic_form). Vypisuje medián a 95. percentil v µs.
+PostgreSQL se použije podle POSTGRES_* z prostředí, SQLite v dočasném adresáři.
+Testovací záznamy se v PostgreSQL na konci smažou.
+
+Spuštění (ze složky software):
+    python benchmarks/bench_database.py [počet_opakování]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+import database  # noqa: E402
+from database_sqlite import SQLiteBackend  # noqa: E402
+
+def measure(operation, repeats):
+    timings = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        operation(i)
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+def bench_backend(backend, repeats):
+    run_id = uuid.uuid4().hex[:8]
+    backend.initialize_database()
+
+    emails = [f"bench-{run_id}-{i}@bench.invalid" for i in range(repeats)]
+    tokens = [f"bench-{run_id}-token-{i}" for i in range(repeats)]
+    results = {}
+    results["registrace"] = measure(lambda i: backend.register_user(emails[i], tokens[i]), repeats)
+    user_ids = [backend.lookup_user_id(token) for token in tokens]
+    results["id z tokenu"] = measure(lambda i: backend.lookup_user_id(tokens[i]), repeats)
+    now_ms = int(time.time() * 1000)
+    results["zápis události"] = measure(
+        lambda i: backend.insert_tracking_events([(user_ids[i], "link_click", tokens[i], "b5p", now_ms, 0, "bench")]),
+        repeats,
+    )
+    return results, emails
+
+def cleanup_postgres(backend, emails):
+    with backend.connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM user_data WHERE email = ANY(%s)", (emails,))
+        conn.commit()
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    table = {}
+
+    try:
+        postgres = database.PostgresBackend()
+        with postgres.connection():
+            pass
+    except Exception as e:
+        print(f"⚠️ PostgreSQL není dostupný, měří se jen SQLite: {e}")
+        postgres = None
+    if postgres is not None:
+        table["postgres"], emails = bench_backend(postgres, repeats)
+        cleanup_postgres(postgres, emails)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sqlite = SQLiteBackend(os.path.join(tmp_dir, "bench.db"))
+        table["sqlite"], _ = bench_backend(sqlite, repeats)
+
+    print(f"{'operace':<16} | {'backend':<8} | {'medián µs':>10} | {'p95 µs':>10}")
+    for operation in next(iter(table.values())):
+        for backend_name, results in table.items():
+            median, p95 = results[operation]
+            print(f"{operation:<16} | {backend_name:<8} | {median:>10.1f} | {p95:>10.1f}")
+
+if __name__ == "__main__":
+    main()
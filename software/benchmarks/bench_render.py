@@ -0,0 +1,72 @@
+"""
+Cena vykreslení stránky na jeden request – dříve a nyní.
+
+Dříve: dynamic_form skládal pro každý request nový zdroj šablony (f-string
+s tokenem a zprávou) a web_api předával velký inline řetězec – obojí šlo do
+render_template_string, takže Jinja šablonu při každém requestu znovu
+parsovala a kompilovala. Nyní: šablony z web_api/templates se zkompilují
+jednou při startu a request jen vyplní kontext; GET formuláře bere stránku
+předvykreslenou při startu a dosadí do ní jen token a kampaň. Vypisuje
+medián a 95. percentil v µs. Nepotřebuje databázi.
+
+Spuštění (ze složky software):
+    python benchmarks/bench_render.py [počet_opakování]
+"""
+import os
+import statistics
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEB_API_DIR = os.path.join(BASE_DIR, "web_api")
+sys.path.insert(0, WEB_API_DIR)
+
+from flask import Flask, render_template, render_template_string  # noqa: E402
+from pages import (  # noqa: E402
+    INDEX_TEMPLATE, FORM_TEMPLATE, TOKEN_SLOT, CAMPAIGN_SLOT,
+    form_context, precompile_templates, split_form_page, fill_form_page
+)
+from assets import register_assets  # noqa: E402
+
+def measure(operation, repeats):
+    timings = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        operation(i)
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    app = Flask("web_api", root_path=WEB_API_DIR, static_folder="static")
+    register_assets(app)
+    precompile_templates(app, INDEX_TEMPLATE, FORM_TEMPLATE)
+
+    contexts = [form_context("b5p", f"token-{i}", "bench", "Podpis byl aktualizován.", "green")
+                for i in range(repeats)]
+    with open(os.path.join(WEB_API_DIR, "templates", INDEX_TEMPLATE), encoding="utf-8") as f:
+        index_source = f.read()
+
+    results = {}
+    with app.test_request_context():
+        # Dřívější zdroj formuláře = hotové HTML s tokenem, jiné pro každý request
+        form_sources = [render_template(FORM_TEMPLATE, **context) for context in contexts]
+        parts = split_form_page(render_template(FORM_TEMPLATE, **form_context("b5p", TOKEN_SLOT, CAMPAIGN_SLOT)))
+        results[("formulář", "render_template_string (dříve)")] = measure(
+            lambda i: render_template_string(form_sources[i]), repeats)
+        results[("formulář", "render_template")] = measure(
+            lambda i: render_template(FORM_TEMPLATE, **contexts[i]), repeats)
+        results[("formulář", "předvykreslená (GET)")] = measure(
+            lambda i: fill_form_page(parts, contexts[i]["token"], "bench"), repeats)
+        results[("registrace", "render_template_string (dříve)")] = measure(
+            lambda i: render_template_string(index_source, message="", message_color=""), repeats)
+        results[("registrace", "render_template")] = measure(
+            lambda i: render_template(INDEX_TEMPLATE, message="", message_color=""), repeats)
+
+    print(f"{'stránka':<12} | {'způsob':<32} | {'medián µs':>10} | {'p95 µs':>10}")
+    for (page, method), (median, p95) in results.items():
+        print(f"{page:<12} | {method:<32} | {median:>10.1f} | {p95:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark zápisu událostí do web_api/storage.py.
+
+Zapisuje kliknutí a odeslání formuláře do dočasného adresáře a po každém
+řádu (1k, 10k, 100k, 1M událostí) vypíše průměrnou cenu jedné události
+v daném úseku (včetně kompakcí) a počet kompakcí. U append-only logu
+má zůstat zhruba konstantní.
+
+S výchozím SNAPSHOT_MIN_BYTES (1 MB) se první kompakce spustí až kolem 20k
+událostí, takže řádky 1k a 10k měří jen připisování do logu. Menší práh
+(např. --snapshot-min-bytes 16384) ukáže cenu kompakce ve všech řádcích.
+
+Spuštění (ze složky software):
+    python benchmarks/bench_storage.py [max_událostí] [--snapshot-min-bytes N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, "web_api"))
+
+import storage  # noqa: E402
+
+FIELDS = ["first_name", "last_name", "position", "department", "phone", "linkedin", "consent"]
+
+def write_event(i):
+    user_id = i % 1000
+    token = f"token-{user_id}"
+    if i % 2 == 0:
+        storage.log_link_click(user_id, token, "b5p")
+    else:
+        storage.append_user_submission(user_id, token, "b5p", {field: True for field in FIELDS})
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark zápisu událostí do storage.py.")
+    parser.add_argument("max_events", nargs="?", type=int, default=1_000_000)
+    parser.add_argument("--snapshot-min-bytes", type=int, default=storage.SNAPSHOT_MIN_BYTES,
+                        help="práh velikosti logu pro kompakci do snapshotu")
+    args = parser.parse_args()
+    max_events = args.max_events
+    storage.SNAPSHOT_MIN_BYTES = args.snapshot_min_bytes
+
+    compactions = 0
+    compact = storage._compact_event_log
+
+    def counted_compact():
+        nonlocal compactions
+        compactions += 1
+        compact()
+
+    storage._compact_event_log = counted_compact
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        storage.JSON_DB_PATH = os.path.join(tmp_dir, "form_data.json")
+        storage.EVENT_LOG_PATH = os.path.join(tmp_dir, "form_events.jsonl")
+        storage.STATS_PATH = os.path.join(tmp_dir, "form_stats.json")
+        storage.LOCK_PATH = os.path.join(tmp_dir, "form_events.lock")
+        # Benchmark zapisuje rychleji než produkce – při plné frontě čekáme, nezahazujeme
+        storage.TRACKING_BLOCK_TIMEOUT = 3600
+
+        written = 0
+        checkpoint = 1000
+        print(f"{'události':>10} | {'µs / událost':>13} | {'kompakce':>8}")
+        while checkpoint <= max_events:
+            start = time.perf_counter()
+            for i in range(written, checkpoint):
+                write_event(i)
+            # Do měření patří i zápis na pozadí, ne jen zařazení do fronty
+            storage.flush_tracking_events(timeout=3600)
+            elapsed = time.perf_counter() - start
+            print(f"{checkpoint:>10} | {elapsed / (checkpoint - written) * 1e6:>13.1f} | {compactions:>8}")
+            written = checkpoint
+            checkpoint *= 10
+
+if __name__ == "__main__":
+    main()
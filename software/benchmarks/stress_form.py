@@ -0,0 +1,87 @@
+"""
+Zátěžový test /form pod více workery.
+
+Spustí N klientských procesů, které souběžně posílají GET na /form běžícího
+dynamic_form (např. pod vícevorkerovým WSGI serverem) a poté ověří, že
+v úložišti přibyl přesně odpovídající počet kliknutí – žádná událost se
+neztratila ani nepoškodila.
+
+Spuštění (ze složky software/web_api, kde leží form_data.json a log událostí):
+    python ../benchmarks/stress_form.py --url http://localhost:5001 --token <token> \\
+        --action b5p --clients 8 --requests 200
+"""
+import argparse
+import os
+import sys
+import time
+import urllib.parse
+import urllib.request
+from multiprocessing import Pool
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, "web_api"))
+
+import storage  # noqa: E402
+
+def count_clicks(token, action, campaign):
+    data = storage.load_json_data(campaign)
+    return sum(
+        1
+        for records in data["users"].values()
+        for record in records
+        if record.get("token") == token and record.get("action") == action
+    )
+
+def hammer(args):
+    url, requests = args
+    failures = 0
+    for _ in range(requests):
+        try:
+            with urllib.request.urlopen(url) as response:
+                response.read()
+                if response.status != 200:
+                    failures += 1
+        except Exception:
+            failures += 1
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Zátěžový test /form pod více workery.")
+    parser.add_argument("--url", default="http://localhost:5001")
+    parser.add_argument("--token", required=True)
+    parser.add_argument("--action", default="b5p")
+    parser.add_argument("--campaign", default=storage.DEFAULT_CAMPAIGN)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="počet requestů na klienta")
+    parser.add_argument("--timeout", type=float, default=30, help="jak dlouho čekat na zápis z front workerů")
+    args = parser.parse_args()
+
+    query = urllib.parse.urlencode({"token": args.token, "action": args.action, "campaign": args.campaign})
+    url = f"{args.url}/form?{query}"
+
+    before = count_clicks(args.token, args.action, args.campaign)
+    start = time.perf_counter()
+    with Pool(args.clients) as pool:
+        failures = sum(pool.map(hammer, [(url, args.requests)] * args.clients))
+    elapsed = time.perf_counter() - start
+
+    sent = args.clients * args.requests
+    expected = before + sent - failures
+    print(f"Odesláno {sent} requestů za {elapsed:.2f} s ({sent / elapsed:.0f} req/s), neúspěšných: {failures}")
+
+    # Workery zapisují na pozadí – počkáme, až se fronty vyprázdní
+    deadline = time.monotonic() + args.timeout
+    after = count_clicks(args.token, args.action, args.campaign)
+    while after < expected and time.monotonic() < deadline:
+        time.sleep(0.5)
+        after = count_clicks(args.token, args.action, args.campaign)
+
+    print(f"Kliknutí před: {before}, po: {after}, očekáváno: {expected}")
+    if after != expected:
+        print(f"❌ Ztracené nebo přebývající události: {expected - after}")
+        sys.exit(1)
+    print("✅ Žádná událost se neztratila.")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,24 @@
 import os
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 import psycopg2
+from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from psycopg2.errors import LockNotAvailable
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 
 # Načtení proměnných prostředí z .env souboru
 load_dotenv()
 
+# Úložiště: "postgres" (výchozí) nebo "sqlite" (vestavěná databáze pro malé nasazení na jednom stroji)
+DB_BACKEND = os.getenv('DB_BACKEND', 'postgres')
+
 # Parametry pro připojení k databázi
 DB_PARAMS = {
     'dbname': os.getenv('POSTGRES_DB'),
@@ -14,115 +28,989 @@ DB_PARAMS = {
     'port': os.getenv('POSTGRES_PORT')
 }
 
-def get_db_connection():
-    """Naváže spojení s databází pomocí nastavení z DB_PARAMS."""
-    try:
-        conn = psycopg2.connect(**DB_PARAMS)
-        return conn
-    except psycopg2.OperationalError as e:
-        print(f"❌ Chyba připojení k DB: {e}")
-        return None
+# Pool spojení (jeden na proces) – spojení se znovu používají, bez TCP/auth handshaku na každý dotaz
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+# Jak dlouho (s) se čeká na volné spojení, když jsou všechna zapůjčená
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+# Spojení nečinné déle než tento počet sekund se před zapůjčením ověří dotazem SELECT 1
+DB_POOL_CHECK_IDLE = float(os.getenv('DB_POOL_CHECK_IDLE', '30'))
 
-def initialize_database():
+# In-process LRU cache token -> id uživatele (s TTL); neplatné tokeny se cachují také (negativně)
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '10000'))
+TOKEN_CACHE_TTL = float(os.getenv('TOKEN_CACHE_TTL', '300'))
+TOKEN_CACHE_NEGATIVE_TTL = float(os.getenv('TOKEN_CACHE_NEGATIVE_TTL', '60'))
+
+# Kolik řádků načte iter_users jedním dotazem (jedna stránka)
+DB_ITERSIZE = int(os.getenv('DB_ITERSIZE', '500'))
+
+# Události se dělí do měsíčních partition podle created_at; tolik měsíců dopředu se zakládá předem
+TRACKING_PARTITIONS_AHEAD = int(os.getenv('TRACKING_PARTITIONS_AHEAD', '2'))
+# Jak dlouho (dny) se drží události; starší smaže purge_tracking_events
+TRACKING_RETENTION_DAYS = int(os.getenv('TRACKING_RETENTION_DAYS', '365'))
+# Jak dlouho (ms) smí odpojení partition čekat na zámek tracking_events; jinak se vzdá
+# a zkusí to příští běh (čekající ACCESS EXCLUSIVE by jinak zablokoval i zápisy za sebou)
+TRACKING_PURGE_LOCK_TIMEOUT = int(os.getenv('TRACKING_PURGE_LOCK_TIMEOUT', '2000'))
+# Kampaň událostí, které ji nemají uvedenou (odkazy a data z doby před kampaněmi);
+# stejná hodnota je výchozí hodnotou sloupce campaign
+DEFAULT_CAMPAIGN = 'default'
+
+USER_COLUMNS = ("email", "token", "email_domain", "social_media", "school", "sports", "other")
+# Počet řádků v jednom vícerádkovém INSERTu
+UPSERT_BATCH_PAGE_SIZE = int(os.getenv('UPSERT_BATCH_PAGE_SIZE', '1000'))
+
+def merge_user_rows(rows):
+    """
+    Sloučí duplicitní e-maily v dávce pro upsert_users_batch.
+    Vrací (hodnoty sloupců USER_COLUMNS pro každý e-mail, výsledky – "merged" nebo None).
+    """
+    merged = {}
+    outcomes = []
+    for row in rows:
+        email = row["email"]
+        values = [row.get(column) for column in USER_COLUMNS]
+        if email in merged:
+            # Stejné pravidlo jako COALESCE(EXCLUDED.x, user_data.x) – novější neprázdná hodnota vyhrává
+            previous = merged[email]
+            merged[email] = [new if new is not None else old for new, old in zip(values, previous)]
+            outcomes.append("merged")
+        else:
+            merged[email] = values
+            outcomes.append(None)
+    return merged, outcomes
+
+def count_first_clicks(user_counters, click_totals):
     """
-    Inicializuje databázi vytvořením tabulky user_data se sloupci:
-    id, email, token, email_domain,
-    social_media, school, sports, other
+    Kolik uživatelů kliklo v dávce na akci poprvé: {(campaign, action): počet}.
+    user_counters jsou přírůstky čítačů podle uživatele (stejné n-tice jako v
+    insert_tracking_events), click_totals nové součty (campaign, bucket, action, clicks)
+    po jejich přičtení. Uživatel kliká poprvé, pokud je nový součet roven přírůstku.
     """
-    conn = get_db_connection()
-    if conn:
+    added = {(campaign, bucket, action): clicks for campaign, _, bucket, action, clicks, _, _ in user_counters}
+    first_clicks = {}
+    for campaign, bucket, action, clicks in click_totals:
+        if clicks > 0 and clicks == added.get((campaign, bucket, action)):
+            first_clicks[(campaign, action)] = first_clicks.get((campaign, action), 0) + 1
+    return first_clicks
+
+def with_unique_users(counters, first_clicks):
+    """Doplní k přírůstkům čítačů přírůstek unique_users (nenulový jen u čítačů podle akce)."""
+    return [
+        (*row, first_clicks.get((row[0], row[3]), 0) if row[1] == "action" else 0)
+        for row in counters
+    ]
+
+def _user_columns(columns):
+    """Ověří názvy sloupců pro iter_users (skládají se do SQL)."""
+    unknown = set(columns) - set(USER_COLUMNS)
+    if unknown:
+        raise ValueError(f"Neznámé sloupce user_data: {', '.join(sorted(unknown))}")
+    return columns
+
+def _month_start(moment):
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def _add_months(month, count):
+    years, month_index = divmod(month.month - 1 + count, 12)
+    return month.replace(year=month.year + years, month=month_index + 1)
+
+def _partition_name(month):
+    return f"tracking_events_{month:%Y_%m}"
+
+
+class DatabaseBackend(ABC):
+    """
+    Rozhraní úložiště, přes které jde veškerý přístup k datům.
+    Funkce na úrovni modulu (upsert_user, register_user, ...) volají backend
+    zvolený proměnnou DB_BACKEND. Neúplný backend selže už při vytvoření instance.
+    """
+    name = None
+    # Výjimky, po kterých má smysl operaci zopakovat (nedostupná nebo přetížená DB);
+    # ostatní chyby (porušení integrity, neplatná data) se opakováním nespraví
+    transient_errors = ()
+
+    @abstractmethod
+    def connection(self):
+        """Kontextový manažer se spojením; potvrzuje se explicitně conn.commit()."""
+
+    @abstractmethod
+    def table_exists(self, table_name):
+        ...
+
+    @abstractmethod
+    def iter_users(self, columns, pending_only=False, itersize=None):
+        ...
+
+    @abstractmethod
+    def initialize_database(self):
+        ...
+
+    @abstractmethod
+    def upsert_user(self, email, token=None, email_domain=None,
+                    social_media=None, school=None, sports=None, other=None):
+        """Vloží nebo aktualizuje záznam podle e-mailu; vrací True, pokud se zápis potvrdil."""
+
+    @abstractmethod
+    def register_user(self, email, token):
+        ...
+
+    @abstractmethod
+    def upsert_users_batch(self, rows):
+        ...
+
+    @abstractmethod
+    def get_existing_emails(self, emails):
+        ...
+
+    @abstractmethod
+    def initialize_token_index(self):
+        ...
+
+    @abstractmethod
+    def lookup_user_id(self, token, email=None):
+        """
+        Id uživatele s daným tokenem (nebo None); chyby DB se propagují.
+        S e-mailem z podepsaného tokenu se uživatel hledá podle e-mailu a token se s ním porovná.
+        """
+
+    @abstractmethod
+    def initialize_processing_columns(self):
+        ...
+
+    @abstractmethod
+    def iter_pending_users(self, itersize=None):
+        ...
+
+    @abstractmethod
+    def mark_user_processed(self, email):
+        ...
+
+    @abstractmethod
+    def initialize_tracking_table(self):
+        ...
+
+    @abstractmethod
+    def insert_tracking_events(self, events, counters=None):
+        """Vloží dávku událostí a přírůstky čítačů v jedné transakci; chyby DB se propagují."""
+
+    @abstractmethod
+    def get_tracking_events(self, campaign=None):
+        ...
+
+    @abstractmethod
+    def get_tracking_counters(self, campaign=None):
+        ...
+
+    @abstractmethod
+    def get_tracking_buckets(self, bucket_type, campaign=None, offset=0, limit=100):
+        ...
+
+    @abstractmethod
+    def purge_tracking_events(self, retention_days=None):
+        """Smaže události starší než retention_days; vrací (smazané partition, smazané řádky)."""
+
+
+class PostgresBackend(DatabaseBackend):
+    """PostgreSQL přes psycopg2 s poolem spojení (jeden pool na proces)."""
+    name = "postgres"
+    transient_errors = (psycopg2.OperationalError, psycopg2.InterfaceError, PoolError)
+
+    def __init__(self, params=None):
+        self.params = params or DB_PARAMS
+        self._pool = None
+        self._pool_pid = None
+        self._pool_slots = None
+        self._pool_lock = threading.Lock()
+        self._last_used = {}
+        # Měsíční partition tracking_events, o kterých tento proces ví, že existují
+        self._partitions = set()
+
+    def _get_pool(self):
+        """Vrátí pool tohoto procesu; po forku (více workerů) se založí nový."""
+        if self._pool_pid != os.getpid():
+            with self._pool_lock:
+                if self._pool_pid != os.getpid():
+                    # Spojení zděděná od rodiče se nezavírají – patří rodičovskému procesu
+                    self._pool = ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, **self.params)
+                    self._pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+                    self._last_used.clear()
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < DB_POOL_CHECK_IDLE:
+            return True
         try:
-            cur = conn.cursor()
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS user_data (
-                    id SERIAL PRIMARY KEY,
-                    email TEXT NOT NULL UNIQUE,
-                    token TEXT,
-                    email_domain TEXT,
-                    social_media TEXT,
-                    school TEXT,
-                    sports TEXT,
-                    other TEXT
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @contextmanager
+    def connection(self):
+        """
+        Zapůjčí spojení z poolu a po skončení bloku ho vrátí.
+        Neukončená transakce se při vrácení odvolá, potvrzuje se explicitně conn.commit().
+        """
+        try:
+            pool = self._get_pool()
+        except psycopg2.OperationalError as e:
+            print(f"❌ Chyba připojení k DB: {e}")
+            raise
+        if not self._pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise PoolError("Vypršel čas čekání na volné spojení z poolu.")
+        try:
+            try:
+                # Po restartu DB mohou být mrtvá všechna spojení v poolu – zahazují se, dokud
+                # nepřijde živé; nejpozději po vyprázdnění poolu se otevře nové
+                for _ in range(DB_POOL_MAX + 1):
+                    conn = pool.getconn()
+                    if self._is_healthy(conn):
+                        break
+                    self._last_used.pop(id(conn), None)
+                    pool.putconn(conn, close=True)
+                else:
+                    raise psycopg2.OperationalError("V poolu není žádné živé spojení k DB.")
+            except psycopg2.OperationalError as e:
+                print(f"❌ Chyba připojení k DB: {e}")
+                raise
+            try:
+                yield conn
+            finally:
+                if not conn.closed:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        pass
+                self._last_used[id(conn)] = time.monotonic()
+                pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            self._pool_slots.release()
+
+    def table_exists(self, table_name):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT EXISTS (
+                    SELECT FROM information_schema.tables
+                    WHERE table_name = %s
                 );
-            ''')
-            conn.commit()
-            print("✅ Databáze byla úspěšně inicializována.")
+            """, (table_name,))
+            return cur.fetchone()[0]
+
+    def iter_users(self, columns, pending_only=False, itersize=None):
+        """
+        Proudově vrací vybrané sloupce (z USER_COLUMNS) user_data v pořadí id, s pending_only
+        jen záznamy, které scraper ještě nezpracoval. Stránkuje se podle id (WHERE id > poslední
+        LIMIT itersize) – každá stránka je krátký samostatný dotaz a mezi stránkami se nedrží
+        spojení z poolu ani otevřená transakce, takže smí být pomalé i zpracování každého řádku
+        (scraping, generování textu).
+        """
+        query = sql.SQL('''
+            SELECT id, {columns} FROM user_data
+            WHERE id > %s {pending}
+            ORDER BY id
+            LIMIT %s
+        ''').format(
+            columns=sql.SQL(", ").join(sql.Identifier(column) for column in _user_columns(columns)),
+            pending=sql.SQL("AND processed_at IS NULL" if pending_only else ""),
+        )
+        itersize = itersize or DB_ITERSIZE
+        last_id = 0
+        while True:
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute(query, (last_id, itersize))
+                rows = cur.fetchall()
+            for row in rows:
+                yield row[1:]
+            if len(rows) < itersize:
+                return
+            last_id = rows[-1][0]
+
+    def initialize_database(self):
+        """
+        Inicializuje databázi vytvořením tabulky user_data se sloupci:
+        id, email, token, email_domain,
+        social_media, school, sports, other
+        a tabulky tracking_events pro záznamy z formuláře.
+        """
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute('''
+                    CREATE TABLE IF NOT EXISTS user_data (
+                        id SERIAL PRIMARY KEY,
+                        email TEXT NOT NULL UNIQUE,
+                        token TEXT,
+                        email_domain TEXT,
+                        social_media TEXT,
+                        school TEXT,
+                        sports TEXT,
+                        other TEXT
+                    );
+                ''')
+                self._create_token_index(cur)
+                self._create_processing_columns(cur)
+                self._create_tracking_table(cur)
+                conn.commit()
+                print("✅ Databáze byla úspěšně inicializována.")
         except Exception as e:
             print(f"❌ Chyba při inicializaci databáze: {e}")
-        finally:
-            cur.close()
-            conn.close()
-    else:
-        print("❌ Nepodařilo se připojit k databázi pro inicializaci.")
 
-def upsert_user(email, token=None, email_domain=None,
-                social_media=None, school=None, sports=None, other=None):
-    """
-    Vloží nový záznam do tabulky user_data nebo aktualizuje existující záznam dle emailu.
-    Aktualizují se sloupce: token, social_media,email_domain, school, sports, other.
-    """
-    conn = get_db_connection()
-    if conn:
+    def upsert_user(self, email, token=None, email_domain=None,
+                    social_media=None, school=None, sports=None, other=None):
+        """
+        Vloží nový záznam do tabulky user_data nebo aktualizuje existující záznam dle emailu.
+        Aktualizují se sloupce: token, social_media,email_domain, school, sports, other.
+        Vrací True po potvrzeném zápisu, při chybě False.
+        """
         try:
-            cur = conn.cursor()
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute('''
+                    INSERT INTO user_data (
+                        email, token, email_domain,
+                        social_media, school, sports, other
+                    )
+                    VALUES (%s, %s, %s,
+                            %s, %s, %s, %s)
+                    ON CONFLICT (email)
+                    DO UPDATE SET
+                        token = COALESCE(EXCLUDED.token, user_data.token),
+                        email_domain = COALESCE(EXCLUDED.email_domain, user_data.email_domain),
+                        social_media = COALESCE(EXCLUDED.social_media, user_data.social_media),
+                        school = COALESCE(EXCLUDED.school, user_data.school),
+                        sports = COALESCE(EXCLUDED.sports, user_data.sports),
+                        other = COALESCE(EXCLUDED.other, user_data.other);
+                ''', (email, token, email_domain,
+                      social_media, school, sports, other))
+                conn.commit()
+                print("✅ Data byla úspěšně vložena/aktualizována.")
+                return True
+        except Exception as e:
+            print(f"❌ Chyba při vkládání/aktualizaci dat: {e}")
+        return False
+
+    def register_user(self, email, token):
+        """
+        Zaregistruje nový e-mail s tokenem jediným příkazem (bez předchozího dotazu na existenci).
+        Vrací id nového záznamu, nebo None, pokud už e-mail v databázi je.
+        """
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute('''
+                    INSERT INTO user_data (email, token)
+                    VALUES (%s, %s)
+                    ON CONFLICT (email) DO NOTHING
+                    RETURNING id;
+                ''', (email, token))
+                result = cur.fetchone()
+                conn.commit()
+                return result[0] if result else None
+        except Exception as e:
+            print(f"❌ Chyba při registraci e-mailu: {e}")
+            raise
+
+    def upsert_users_batch(self, rows):
+        """
+        Dávková varianta upsert_user – celá dávka v jedné transakci, po UPSERT_BATCH_PAGE_SIZE
+        řádcích na jeden vícerádkový INSERT ... ON CONFLICT se stejnou COALESCE sémantikou.
+        Řádek je slovník se sloupci USER_COLUMNS (email povinný, chybějící sloupce = None).
+
+        Vrací seznam výsledků ve stejném pořadí jako rows: "inserted", "updated",
+        nebo "merged" pro duplicitní e-mail v dávce (sloučen do jeho prvního výskytu).
+        Při chybě se nic nezapíše a vrací se None.
+        """
+        rows = list(rows)
+        merged, outcomes = merge_user_rows(rows)
+        if not merged:
+            return outcomes
+
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                # xmax = 0 právě u nově vložených řádků, u aktualizovaných nese id transakce
+                results = execute_values(cur, '''
+                    INSERT INTO user_data (
+                        email, token, email_domain,
+                        social_media, school, sports, other
+                    )
+                    VALUES %s
+                    ON CONFLICT (email)
+                    DO UPDATE SET
+                        token = COALESCE(EXCLUDED.token, user_data.token),
+                        email_domain = COALESCE(EXCLUDED.email_domain, user_data.email_domain),
+                        social_media = COALESCE(EXCLUDED.social_media, user_data.social_media),
+                        school = COALESCE(EXCLUDED.school, user_data.school),
+                        sports = COALESCE(EXCLUDED.sports, user_data.sports),
+                        other = COALESCE(EXCLUDED.other, user_data.other)
+                    RETURNING email, (xmax = 0)
+                ''', list(merged.values()), page_size=UPSERT_BATCH_PAGE_SIZE, fetch=True)
+                conn.commit()
+        except Exception as e:
+            print(f"❌ Chyba při dávkovém vkládání/aktualizaci dat: {e}")
+            return None
+
+        inserted = dict(results)
+        return [
+            outcome or ("inserted" if inserted[row["email"]] else "updated")
+            for row, outcome in zip(rows, outcomes)
+        ]
+
+    def get_existing_emails(self, emails):
+        """Vrátí množinu e-mailů z daného seznamu, které už jsou v user_data (jeden dotaz)."""
+        if not emails:
+            return set()
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute("SELECT email FROM user_data WHERE email = ANY(%s)", (list(emails),))
+                return {row[0] for row in cur.fetchall()}
+        except Exception as e:
+            print(f"❌ Chyba při ověřování existence e-mailů: {e}")
+            raise
+
+    def _create_token_index(self, cur):
+        """Index pro vyhledání uživatele podle tokenu z odkazu ve formuláři."""
+        cur.execute('''
+            CREATE INDEX IF NOT EXISTS idx_user_data_token
+            ON user_data (token);
+        ''')
+
+    def initialize_token_index(self):
+        """Vytvoří index user_data.token, pokud ještě neexistuje."""
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                self._create_token_index(cur)
+                conn.commit()
+        except Exception as e:
+            print(f"❌ Chyba při vytváření indexu tokenů: {e}")
+
+    def lookup_user_id(self, token, email=None):
+        with self.connection() as conn, conn.cursor() as cur:
+            if email is not None:
+                # Unikátní index na e-mailu; token musí odpovídat tomu, který má uživatel uložený
+                cur.execute("SELECT id FROM user_data WHERE email = %s AND token = %s", (email, token))
+            else:
+                cur.execute("SELECT id FROM user_data WHERE token = %s LIMIT 1", (token,))
+            result = cur.fetchone()
+        return result[0] if result else None
+
+    def _create_processing_columns(self, cur):
+        """
+        Sloupec processed_at (kdy scraper záznam zpracoval) a částečný index nad
+        dosud nezpracovanými záznamy. Záznamy, které už data ze scraperu mají,
+        se označí jako zpracované (dřívější filtr ve scraper.main).
+        """
+        cur.execute("ALTER TABLE user_data ADD COLUMN IF NOT EXISTS processed_at TIMESTAMPTZ;")
+        cur.execute('''
+            CREATE INDEX IF NOT EXISTS idx_user_data_unprocessed
+            ON user_data (id) WHERE processed_at IS NULL;
+        ''')
+        cur.execute('''
+            UPDATE user_data SET processed_at = now()
+            WHERE processed_at IS NULL
+              AND (COALESCE(social_media, '') <> '' OR COALESCE(school, '') <> ''
+                   OR COALESCE(sports, '') <> '' OR COALESCE(other, '') <> '');
+        ''')
+
+    def initialize_processing_columns(self):
+        """Doplní do user_data sloupec processed_at a index nezpracovaných záznamů, pokud chybí."""
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                self._create_processing_columns(cur)
+                conn.commit()
+        except Exception as e:
+            print(f"❌ Chyba při inicializaci sloupce processed_at: {e}")
+
+    def iter_pending_users(self, itersize=None):
+        """Proudově vrací e-maily záznamů, které scraper ještě nezpracoval (přes částečný index)."""
+        for row in self.iter_users(("email",), pending_only=True, itersize=itersize):
+            yield row[0]
+
+    def mark_user_processed(self, email):
+        """Označí záznam jako zpracovaný scraperem."""
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute("UPDATE user_data SET processed_at = now() WHERE email = %s", (email,))
+                conn.commit()
+        except Exception as e:
+            print(f"❌ Chyba při označení záznamu jako zpracovaného: {e}")
+
+    def _create_tracking_table(self, cur):
+        """
+        Vytvoří tabulku tracking_events rozdělenou podle created_at na měsíční partition
+        (tracking_events_RRRR_MM, předem na TRACKING_PARTITIONS_AHEAD měsíců dopředu
+        a výchozí tracking_events_default pro cokoli mimo ně) včetně indexů a tabulku čítačů.
+        Dřívější nerozdělenou tabulku převede i s daty.
+        """
+        # Souběžně startující workery se nesmí předbíhat (migrace, zakládání partition)
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('tracking_events_schema'))")
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('tracking_events')")
+        row = cur.fetchone()
+        legacy = row is not None and row[0] == 'r'
+        if legacy:
+            cur.execute("ALTER TABLE tracking_events RENAME TO tracking_events_legacy")
+            cur.execute("ALTER INDEX IF EXISTS tracking_events_pkey RENAME TO tracking_events_legacy_pkey")
+            cur.execute("ALTER SEQUENCE IF EXISTS tracking_events_id_seq RENAME TO tracking_events_legacy_id_seq")
+            cur.execute("DROP INDEX IF EXISTS idx_tracking_events_user_created, idx_tracking_events_action_created")
+
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS tracking_events (
+                id BIGSERIAL,
+                user_id INTEGER NOT NULL REFERENCES user_data(id) ON DELETE CASCADE,
+                event_type TEXT NOT NULL CHECK (event_type IN ('link_click', 'submission')),
+                token TEXT,
+                action TEXT NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL,
+                field_mask INTEGER NOT NULL DEFAULT 0,
+                campaign TEXT NOT NULL DEFAULT 'default',
+                PRIMARY KEY (id, created_at)
+            ) PARTITION BY RANGE (created_at);
+        ''')
+        # Tabulka z doby před kampaněmi – konstantní výchozí hodnota nepřepisuje existující řádky
+        cur.execute("ALTER TABLE tracking_events ADD COLUMN IF NOT EXISTS campaign TEXT NOT NULL DEFAULT 'default';")
+        cur.execute("CREATE TABLE IF NOT EXISTS tracking_events_default PARTITION OF tracking_events DEFAULT;")
+        cur.execute('''
+            CREATE INDEX IF NOT EXISTS idx_tracking_events_user_created
+            ON tracking_events (user_id, created_at);
+        ''')
+        cur.execute('''
+            CREATE INDEX IF NOT EXISTS idx_tracking_events_action_created
+            ON tracking_events (action, created_at);
+        ''')
+        # Reporty a párování odeslání s kliknutím čtou jen data jedné kampaně
+        cur.execute('''
+            CREATE INDEX IF NOT EXISTS idx_tracking_events_campaign_user_created
+            ON tracking_events (campaign, user_id, created_at);
+        ''')
+
+        current = _month_start(datetime.now(timezone.utc))
+        months = [_add_months(current, i) for i in range(TRACKING_PARTITIONS_AHEAD + 1)]
+        if legacy:
+            cur.execute("SELECT min(created_at), max(created_at) FROM tracking_events_legacy")
+            oldest, newest = cur.fetchone()
+            if oldest is not None:
+                month = _month_start(oldest.astimezone(timezone.utc))
+                while month <= newest:
+                    months.append(month)
+                    month = _add_months(month, 1)
+        self._ensure_partitions(cur, months)
+
+        if legacy:
             cur.execute('''
-                INSERT INTO user_data (
-                    email, token, email_domain,
-                    social_media, school, sports, other
+                INSERT INTO tracking_events (id, user_id, event_type, token, action, created_at, field_mask)
+                SELECT id, user_id, event_type, token, action, created_at, field_mask
+                FROM tracking_events_legacy
+            ''')
+            cur.execute('''
+                SELECT setval(pg_get_serial_sequence('tracking_events', 'id'),
+                              COALESCE((SELECT max(id) FROM tracking_events), 0) + 1, false)
+            ''')
+            cur.execute("DROP TABLE tracking_events_legacy")
+            print("✅ Tabulka tracking_events byla převedena na měsíční partition.")
+
+        # Průběžně udržované čítače pro /stats (bucket_type: action / user / hour) po kampaních
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS tracking_counters (
+                campaign TEXT NOT NULL DEFAULT 'default',
+                bucket_type TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                action TEXT NOT NULL,
+                clicks BIGINT NOT NULL DEFAULT 0,
+                submissions BIGINT NOT NULL DEFAULT 0,
+                validation_failures BIGINT NOT NULL DEFAULT 0,
+                unique_users BIGINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (campaign, bucket_type, bucket, action)
+            );
+        ''')
+        cur.execute('''
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'tracking_counters' AND column_name = 'campaign'
+        ''')
+        if cur.fetchone() is None:
+            # Čítače z doby před kampaněmi patří výchozí kampani
+            cur.execute('''
+                ALTER TABLE tracking_counters
+                    ADD COLUMN campaign TEXT NOT NULL DEFAULT 'default',
+                    DROP CONSTRAINT tracking_counters_pkey,
+                    ADD PRIMARY KEY (campaign, bucket_type, bucket, action);
+            ''')
+        cur.execute('''
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'tracking_counters' AND column_name = 'unique_users'
+        ''')
+        if cur.fetchone() is None:
+            # Počet uživatelů, kteří na akci klikli (jen u bucket_type 'action'), se dál
+            # udržuje při zápisu; u dosavadních čítačů se jednou dopočítá
+            cur.execute("ALTER TABLE tracking_counters ADD COLUMN unique_users BIGINT NOT NULL DEFAULT 0;")
+            cur.execute('''
+                UPDATE tracking_counters AS counters SET unique_users = users.count
+                FROM (
+                    SELECT campaign, action, count(*) AS count
+                    FROM tracking_counters
+                    WHERE bucket_type = 'user' AND clicks > 0
+                    GROUP BY campaign, action
+                ) AS users
+                WHERE counters.bucket_type = 'action'
+                  AND counters.campaign = users.campaign AND counters.action = users.action;
+            ''')
+        # /stats čte jen čítače podle akce, rozpis podle uživatele a hodiny se stránkuje
+        cur.execute('''
+            CREATE INDEX IF NOT EXISTS idx_tracking_counters_bucket
+            ON tracking_counters (bucket_type, campaign, bucket);
+        ''')
+
+    def _ensure_partitions(self, cur, months):
+        """Založí chybějící měsíční partition (první den měsíce v UTC)."""
+        for month in sorted(set(months)):
+            name = _partition_name(month)
+            if name in self._partitions:
+                continue
+            cur.execute("SAVEPOINT create_partition")
+            try:
+                cur.execute(sql.SQL(
+                    "CREATE TABLE IF NOT EXISTS {} PARTITION OF tracking_events FOR VALUES FROM (%s) TO (%s)"
+                ).format(sql.Identifier(name)), (month, _add_months(month, 1)))
+                cur.execute("RELEASE SAVEPOINT create_partition")
+            except psycopg2.Error as e:
+                # Typicky už výchozí partition obsahuje řádky z tohoto měsíce – zůstanou v ní
+                cur.execute("ROLLBACK TO SAVEPOINT create_partition")
+                print(f"⚠️ Partition {name} nelze vytvořit, události zůstanou ve výchozí partition: {e}")
+            self._partitions.add(name)
+
+    def initialize_tracking_table(self):
+        """Vytvoří tabulky tracking_events a tracking_counters, pokud ještě neexistují."""
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                self._create_tracking_table(cur)
+                conn.commit()
+        except Exception as e:
+            print(f"❌ Chyba při inicializaci tabulky tracking_events: {e}")
+
+    def insert_tracking_events(self, events, counters=None):
+        """
+        Vloží dávku událostí jedním vícerádkovým INSERTem.
+        Událost je n-tice (user_id, event_type, token, action, epoch ms, field_mask, campaign).
+        Ve stejné transakci přičte k tabulce tracking_counters přírůstky čítačů
+        (campaign, bucket_type, bucket, action, clicks, submissions, validation_failures).
+        Chyby DB se propagují – podle transient_errors se pozná, zda dávku zopakovat.
+        """
+        if not events:
+            return
+        # Řádky se zamykají ve stejném pořadí ve všech workerech (po měsících, resp. podle klíče
+        # čítače) – jinak by se souběžné dávky mohly navzájem zablokovat (DeadlockDetected)
+        events = sorted(events, key=lambda event: event[4])
+        with self.connection() as conn, conn.cursor() as cur:
+            # Dávka z nového měsíce si partition založí sama (jinak by skončila ve výchozí)
+            months = {_month_start(datetime.fromtimestamp(event[4] / 1000, timezone.utc)) for event in events}
+            if any(_partition_name(month) not in self._partitions for month in months):
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext('tracking_events_schema'))")
+                self._ensure_partitions(cur, months)
+            execute_values(cur, '''
+                INSERT INTO tracking_events (
+                    user_id, event_type, token, action,
+                    created_at, field_mask, campaign
                 )
-                VALUES (%s, %s, %s,
-                        %s, %s, %s, %s)
-                ON CONFLICT (email) 
-                DO UPDATE SET 
-                    token = COALESCE(EXCLUDED.token, user_data.token),
-                    email_domain = COALESCE(EXCLUDED.email_domain, user_data.email_domain),
-                    social_media = COALESCE(EXCLUDED.social_media, user_data.social_media),
-                    school = COALESCE(EXCLUDED.school, user_data.school),
-                    sports = COALESCE(EXCLUDED.sports, user_data.sports),
-                    other = COALESCE(EXCLUDED.other, user_data.other);
-            ''', (email, token, email_domain,
-                  social_media, school, sports, other))
+                VALUES %s
+            ''', events, template="(%s, %s, %s, %s, to_timestamp(%s / 1000.0), %s, %s)",
+               page_size=len(events))
+            if counters:
+                # Nejdřív čítače podle uživatele – z jejich nových hodnot je vidět, kdo klikl
+                # poprvé (souběžné zápisy serializuje zámek řádku), a o ty se zvýší unique_users
+                user_counters = [row for row in counters if row[1] == "user"]
+                click_totals = self._upsert_counters(cur, with_unique_users(user_counters, {}))
+                self._upsert_counters(cur, with_unique_users(
+                    [row for row in counters if row[1] != "user"],
+                    count_first_clicks(user_counters, click_totals)
+                ))
             conn.commit()
-            print("✅ Data byla úspěšně vložena/aktualizována.")
+
+    def _upsert_counters(self, cur, counters):
+        """Přičte přírůstky čítačů (v pořadí primárního klíče); vrací nové součty kliknutí (campaign, bucket, action, clicks)."""
+        if not counters:
+            return []
+        counters = sorted(counters, key=lambda row: row[:4])
+        return execute_values(cur, '''
+            INSERT INTO tracking_counters (
+                campaign, bucket_type, bucket, action,
+                clicks, submissions, validation_failures, unique_users
+            )
+            VALUES %s
+            ON CONFLICT (campaign, bucket_type, bucket, action)
+            DO UPDATE SET
+                clicks = tracking_counters.clicks + EXCLUDED.clicks,
+                submissions = tracking_counters.submissions + EXCLUDED.submissions,
+                validation_failures = tracking_counters.validation_failures + EXCLUDED.validation_failures,
+                unique_users = tracking_counters.unique_users + EXCLUDED.unique_users
+            RETURNING campaign, bucket, action, clicks
+        ''', counters, page_size=len(counters), fetch=True)
+
+    def get_tracking_events(self, campaign=None):
+        """
+        Vrátí události v pořadí vzniku jako n-tice
+        (user_id, event_type, token, action, epoch ms, field_mask, campaign),
+        volitelně jen z jedné kampaně (přes index podle kampaně).
+        """
+        where = "WHERE campaign = %s" if campaign is not None else ""
+        params = (campaign,) if campaign is not None else ()
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute(f'''
+                    SELECT user_id, event_type, token, action,
+                           (EXTRACT(EPOCH FROM created_at) * 1000)::BIGINT, field_mask, campaign
+                    FROM tracking_events
+                    {where}
+                    ORDER BY created_at, id
+                ''', params)
+                return cur.fetchall()
         except Exception as e:
-            conn.rollback()
-            print(f"❌ Chyba při vkládání/aktualizaci dat: {e}")
-        finally:
-            cur.close()
-            conn.close()
-    else:
-        print("❌ Nepodařilo se připojit k databázi.")
+            print(f"❌ Chyba při načítání událostí: {e}")
+        return []
+
+    def get_tracking_counters(self, campaign=None):
+        """
+        Vrátí čítače podle akce (všech kampaní, nebo jen jedné) jako n-tice
+        (campaign, action, clicks, submissions, validation_failures, unique_users).
+        Počet řádků nezávisí na počtu uživatelů ani délce kampaně.
+        """
+        where = "AND campaign = %s" if campaign is not None else ""
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute(f'''
+                    SELECT campaign, action,
+                           clicks, submissions, validation_failures, unique_users
+                    FROM tracking_counters
+                    WHERE bucket_type = 'action' {where}
+                ''', (campaign,) if campaign is not None else None)
+                return cur.fetchall()
+        except Exception as e:
+            print(f"❌ Chyba při načítání čítačů: {e}")
+        return []
+
+    def get_tracking_buckets(self, bucket_type, campaign=None, offset=0, limit=100):
+        """
+        Stránka rozpisu čítačů podle uživatele (bucket_type 'user') nebo hodiny ('hour'):
+        limit bucketů od pozice offset (řazeno podle kampaně a bucketu) jako n-tice
+        (campaign, bucket, action, clicks, submissions, validation_failures).
+        """
+        where = "AND campaign = %s" if campaign is not None else ""
+        params = [bucket_type, bucket_type] + ([campaign] if campaign is not None else []) + [limit, offset]
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                cur.execute(f'''
+                    SELECT campaign, bucket, action,
+                           clicks, submissions, validation_failures
+                    FROM tracking_counters
+                    WHERE bucket_type = %s AND (campaign, bucket) IN (
+                        SELECT DISTINCT campaign, bucket
+                        FROM tracking_counters
+                        WHERE bucket_type = %s {where}
+                        ORDER BY campaign, bucket
+                        LIMIT %s OFFSET %s
+                    )
+                    ORDER BY campaign, bucket, action
+                ''', params)
+                return cur.fetchall()
+        except Exception as e:
+            print(f"❌ Chyba při načítání čítačů: {e}")
+        return []
+
+
+    def purge_tracking_events(self, retention_days=None):
+        """
+        Retence: celé měsíční partition starší než retention_days (výchozí
+        TRACKING_RETENTION_DAYS) se odpojí a zahodí – bez mazání po řádcích.
+        Každý krok běží ve vlastní krátké transakci: odpojení (DETACH PARTITION
+        s lock_timeout, protože CONCURRENTLY PostgreSQL u tabulky s výchozí
+        partition nedovolí), DROP TABLE odpojené tabulky a nakonec smazání
+        starých řádků z výchozí partition. Čítače v tracking_counters zůstávají.
+        """
+        if retention_days is None:
+            retention_days = TRACKING_RETENTION_DAYS
+        cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+        dropped = []
+        try:
+            with self.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute('''
+                        SELECT child.relname
+                        FROM pg_inherits
+                        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                        WHERE pg_inherits.inhparent = 'tracking_events'::regclass
+                    ''')
+                    names = [name for (name,) in cur.fetchall()]
+                conn.commit()
+
+                for name in sorted(names):
+                    match = re.fullmatch(r"tracking_events_(\d{4})_(\d{2})", name)
+                    if not match:
+                        continue
+                    month = datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+                    if _add_months(month, 1) > cutoff:
+                        continue
+                    try:
+                        with conn.cursor() as cur:
+                            # Souběžné zakládání partition (zápis událostí) se nesmí předbíhat
+                            cur.execute("SELECT pg_advisory_xact_lock(hashtext('tracking_events_schema'))")
+                            cur.execute("SET LOCAL lock_timeout = %s", (TRACKING_PURGE_LOCK_TIMEOUT,))
+                            cur.execute(sql.SQL("ALTER TABLE tracking_events DETACH PARTITION {}").format(
+                                sql.Identifier(name)))
+                        conn.commit()
+                    except LockNotAvailable:
+                        conn.rollback()
+                        print(f"⚠️ Partition {name} se nepodařilo odpojit (zámek), zkusí se příště.")
+                        continue
+                    # Odpojená tabulka už s tracking_events nesouvisí – DROP nezamyká živý provoz
+                    with conn.cursor() as cur:
+                        cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+                    conn.commit()
+                    dropped.append(name)
+
+                with conn.cursor() as cur:
+                    cur.execute("DELETE FROM tracking_events_default WHERE created_at < %s", (cutoff,))
+                    deleted = cur.rowcount
+                conn.commit()
+        except Exception as e:
+            print(f"❌ Chyba při mazání starých událostí: {e}")
+            self._partitions.difference_update(dropped)
+            return dropped, 0
+        self._partitions.difference_update(dropped)
+        print(f"✅ Smazáno partition: {len(dropped)}, řádků z výchozí partition: {deleted}.")
+        return dropped, deleted
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def create_backend(name=None):
+    """Vytvoří backend podle jména ("postgres" / "sqlite"), výchozí je DB_BACKEND."""
+    name = name or DB_BACKEND
+    if name == "postgres":
+        return PostgresBackend()
+    if name == "sqlite":
+        from database_sqlite import SQLiteBackend
+        return SQLiteBackend()
+    raise ValueError(f"Neznámý DB_BACKEND: {name}")
+
+def get_backend():
+    """Backend zvolený proměnnou DB_BACKEND (jedna instance na proces)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+def db_connection():
+    """Spojení aktuálního backendu (kontextový manažer)."""
+    return get_backend().connection()
+
+def table_exists(table_name):
+    return get_backend().table_exists(table_name)
+
+def iter_users(columns, pending_only=False, itersize=None):
+    return get_backend().iter_users(columns, pending_only, itersize)
+
+def initialize_database():
+    return get_backend().initialize_database()
+
+def upsert_user(email, token=None, email_domain=None,
+                social_media=None, school=None, sports=None, other=None):
+    return get_backend().upsert_user(email, token, email_domain,
+                                     social_media, school, sports, other)
+
+def register_user(email, token):
+    return get_backend().register_user(email, token)
+
+def upsert_users_batch(rows):
+    return get_backend().upsert_users_batch(rows)
+
+def get_existing_emails(emails):
+    return get_backend().get_existing_emails(emails)
+
+def initialize_token_index():
+    return get_backend().initialize_token_index()
+
+def initialize_processing_columns():
+    return get_backend().initialize_processing_columns()
+
+def iter_pending_users(itersize=None):
+    return get_backend().iter_pending_users(itersize)
+
+def mark_user_processed(email):
+    return get_backend().mark_user_processed(email)
+
+def initialize_tracking_table():
+    return get_backend().initialize_tracking_table()
+
+def insert_tracking_events(events, counters=None):
+    return get_backend().insert_tracking_events(events, counters)
+
+def is_transient_error(error):
+    """Zda jde o přechodnou chybu aktuálního backendu (výpadek spojení, zámek), po které se zkouší znovu."""
+    return isinstance(error, get_backend().transient_errors)
+
+def get_tracking_events(campaign=None):
+    return get_backend().get_tracking_events(campaign)
+
+def get_tracking_counters(campaign=None):
+    return get_backend().get_tracking_counters(campaign)
+
+def get_tracking_buckets(bucket_type, campaign=None, offset=0, limit=100):
+    return get_backend().get_tracking_buckets(bucket_type, campaign, offset, limit)
+
+def purge_tracking_events(retention_days=None):
+    return get_backend().purge_tracking_events(retention_days)
+
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+def get_cached_user_id(token):
+    """Vrátí (nalezeno, id uživatele) z cache tokenů; prošlé záznamy se neberou."""
+    with _token_cache_lock:
+        cached = _token_cache.get(token)
+        if cached is not None and cached[0] > time.monotonic():
+            _token_cache.move_to_end(token)
+            return True, cached[1]
+    return False, None
+
+def cache_user_id(token, user_id):
+    """Uloží výsledek dohledání tokenu do LRU cache (neplatný token s kratším TTL)."""
+    ttl = TOKEN_CACHE_TTL if user_id is not None else TOKEN_CACHE_NEGATIVE_TTL
+    with _token_cache_lock:
+        _token_cache[token] = (time.monotonic() + ttl, user_id)
+        _token_cache.move_to_end(token)
+        while len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+
+def resolve_user_id(token, email=None):
+    """
+    Vrátí id uživatele s daným tokenem, nebo None pro neplatný token.
+    Jediný dotaz – s e-mailem z ověřeného podpisu tokenu (tokens.verify_token) přes
+    unikátní index na e-mailu, jinak přes index na tokenu; výsledek se drží v LRU cache
+    s TTL, neplatné tokeny po kratší dobu TOKEN_CACHE_NEGATIVE_TTL.
+    """
+    found, user_id = get_cached_user_id(token)
+    if found:
+        return user_id
+
+    try:
+        user_id = get_backend().lookup_user_id(token, email)
+    except Exception as e:
+        # Chyba DB se necachuje
+        print(f"❌ Chyba při získávání ID z tokenu: {e}")
+        return None
+
+    cache_user_id(token, user_id)
+    return user_id
 
 #fuknce pro formulář - získání tokenu
 def token_exists(token):
-    conn = get_db_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("SELECT 1 FROM user_data WHERE token = %s", (token,))
-            exists = cur.fetchone() is not None
-            cur.close()
-            conn.close()
-            return exists
-        except Exception as e:
-            print(f"❌ Chyba při kontrole tokenu: {e}")
-    return False
+    return resolve_user_id(token) is not None
 
 #fuknce pro formulář - získání id z tokenu
 def get_user_id_by_token(token):
-    conn = get_db_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("SELECT id FROM user_data WHERE token = %s", (token,))
-            result = cur.fetchone()
-            cur.close()
-            conn.close()
-            if result:
-                return result[0]
-        except Exception as e:
-            print(f"Chyba při získávání ID z tokenu: {e}")
-    return None
+    return resolve_user_id(token)
 
 
 
@@ -0,0 +1,120 @@
+"""
+Asynchronní přístup k PostgreSQL (asyncpg) pro ASGI verze web_api a dynamic_form.
+
+Zrcadlí funkce z database.py, které obsluhují requesty (token_exists,
+get_user_id_by_token, upsert_user, register_user). Čekání na databázi
+nedrží vlákno – jeden proces tak obslouží tisíce souběžných kliknutí. Pool
+je vlastní (jeden na proces a event loop), cache tokenů je sdílená
+s database.py. Události zapisuje storage.py přes database.py na pozadí.
+"""
+import asyncio
+import os
+import asyncpg
+from database import DB_PARAMS, DB_POOL_MIN, DB_POOL_TIMEOUT, get_cached_user_id, cache_user_id
+
+# Velikost async poolu – spojení se drží jen po dobu dotazu, takže jich stačí málo i na tisíce requestů
+ASYNC_DB_POOL_MAX = int(os.getenv('ASYNC_DB_POOL_MAX', '20'))
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+async def get_pool():
+    """Vrátí async pool; vytvoří se při prvním použití."""
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                try:
+                    _pool = await asyncpg.create_pool(
+                        database=DB_PARAMS['dbname'],
+                        user=DB_PARAMS['user'],
+                        password=DB_PARAMS['password'],
+                        host=DB_PARAMS['host'],
+                        port=int(DB_PARAMS['port']) if DB_PARAMS['port'] else None,
+                        min_size=DB_POOL_MIN,
+                        max_size=ASYNC_DB_POOL_MAX,
+                    )
+                except (OSError, asyncpg.PostgresError) as e:
+                    print(f"❌ Chyba připojení k DB: {e}")
+                    raise
+    return _pool
+
+async def close_pool():
+    """Zavře async pool (při ukončení aplikace)."""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+async def resolve_user_id(token, email=None):
+    """Async varianta database.resolve_user_id (stejná LRU cache s TTL, s e-mailem hledá podle e-mailu)."""
+    found, user_id = get_cached_user_id(token)
+    if found:
+        return user_id
+
+    try:
+        pool = await get_pool()
+        if email is not None:
+            user_id = await pool.fetchval(
+                "SELECT id FROM user_data WHERE email = $1 AND token = $2", email, token, timeout=DB_POOL_TIMEOUT
+            )
+        else:
+            user_id = await pool.fetchval(
+                "SELECT id FROM user_data WHERE token = $1 LIMIT 1", token, timeout=DB_POOL_TIMEOUT
+            )
+    except Exception as e:
+        # Chyba DB se necachuje
+        print(f"❌ Chyba při získávání ID z tokenu: {e}")
+        return None
+
+    cache_user_id(token, user_id)
+    return user_id
+
+#fuknce pro formulář - získání tokenu
+async def token_exists(token):
+    return await resolve_user_id(token) is not None
+
+#fuknce pro formulář - získání id z tokenu
+async def get_user_id_by_token(token):
+    return await resolve_user_id(token)
+
+async def upsert_user(email, token=None, email_domain=None,
+                      social_media=None, school=None, sports=None, other=None):
+    """Async varianta database.upsert_user (stejná COALESCE sémantika, vrací True po potvrzeném zápisu)."""
+    try:
+        pool = await get_pool()
+        await pool.execute('''
+            INSERT INTO user_data (
+                email, token, email_domain,
+                social_media, school, sports, other
+            )
+            VALUES ($1, $2, $3,
+                    $4, $5, $6, $7)
+            ON CONFLICT (email)
+            DO UPDATE SET
+                token = COALESCE(EXCLUDED.token, user_data.token),
+                email_domain = COALESCE(EXCLUDED.email_domain, user_data.email_domain),
+                social_media = COALESCE(EXCLUDED.social_media, user_data.social_media),
+                school = COALESCE(EXCLUDED.school, user_data.school),
+                sports = COALESCE(EXCLUDED.sports, user_data.sports),
+                other = COALESCE(EXCLUDED.other, user_data.other);
+        ''', email, token, email_domain, social_media, school, sports, other, timeout=DB_POOL_TIMEOUT)
+        print("✅ Data byla úspěšně vložena/aktualizována.")
+        return True
+    except Exception as e:
+        print(f"❌ Chyba při vkládání/aktualizaci dat: {e}")
+    return False
+
+async def register_user(email, token):
+    """Async varianta database.register_user – id nového záznamu, nebo None pro existující e-mail."""
+    try:
+        pool = await get_pool()
+        return await pool.fetchval('''
+            INSERT INTO user_data (email, token)
+            VALUES ($1, $2)
+            ON CONFLICT (email) DO NOTHING
+            RETURNING id;
+        ''', email, token, timeout=DB_POOL_TIMEOUT)
+    except Exception as e:
+        print(f"❌ Chyba při registraci e-mailu: {e}")
+        raise
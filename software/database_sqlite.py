@@ -0,0 +1,490 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from database import (
+    DatabaseBackend, merge_user_rows, count_first_clicks, with_unique_users, _user_columns,
+    DB_ITERSIZE, UPSERT_BATCH_PAGE_SIZE, TRACKING_RETENTION_DAYS
+)
+
+# Soubor databáze pro DB_BACKEND=sqlite (malé nasazení na jednom stroji)
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'phishing.db')
+# Jak dlouho (s) se čeká na zámek zápisu, než se dotaz vzdá
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', '10'))
+# Počet připravených (zkompilovaných) dotazů, které si každé spojení drží v cache
+SQLITE_STATEMENT_CACHE = int(os.getenv('SQLITE_STATEMENT_CACHE', '256'))
+# Nejvíce parametrů v jednom dotazu WHERE email IN (...) (starší SQLite mají limit 999)
+SQLITE_MAX_IN_PARAMS = 500
+
+_UPSERT_USER_SQL = '''
+    INSERT INTO user_data (
+        email, token, email_domain,
+        social_media, school, sports, other
+    )
+    VALUES (?, ?, ?,
+            ?, ?, ?, ?)
+    ON CONFLICT (email)
+    DO UPDATE SET
+        token = COALESCE(excluded.token, user_data.token),
+        email_domain = COALESCE(excluded.email_domain, user_data.email_domain),
+        social_media = COALESCE(excluded.social_media, user_data.social_media),
+        school = COALESCE(excluded.school, user_data.school),
+        sports = COALESCE(excluded.sports, user_data.sports),
+        other = COALESCE(excluded.other, user_data.other);
+'''
+
+_UPSERT_COUNTER_SQL = '''
+    INSERT INTO tracking_counters (
+        campaign, bucket_type, bucket, action,
+        clicks, submissions, validation_failures, unique_users
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (campaign, bucket_type, bucket, action)
+    DO UPDATE SET
+        clicks = clicks + excluded.clicks,
+        submissions = submissions + excluded.submissions,
+        validation_failures = validation_failures + excluded.validation_failures,
+        unique_users = unique_users + excluded.unique_users
+'''
+
+
+class SQLiteBackend(DatabaseBackend):
+    """
+    Vestavěná SQLite databáze: WAL (čtení neblokuje zápis), jedno trvalé spojení
+    na vlákno (a proces) a připravené dotazy – dotazy jsou konstantní řetězce,
+    takže je sqlite3 zkompiluje jednou a dál bere ze statement cache spojení.
+    """
+    name = "sqlite"
+    # Zamčená databáze (busy timeout vypršel) nebo chyba I/O
+    transient_errors = (sqlite3.OperationalError,)
+
+    def __init__(self, path=None):
+        self.path = path or SQLITE_PATH
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT,
+                               cached_statements=SQLITE_STATEMENT_CACHE)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Ve WAL stačí fsync při checkpointu – commit nečeká na disk
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """
+        Trvalé spojení aktuálního vlákna (po forku se otevře nové).
+        Neukončená transakce se na konci bloku odvolá, potvrzuje se explicitně conn.commit().
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            try:
+                conn = self._connect()
+            except sqlite3.Error as e:
+                print(f"❌ Chyba připojení k DB: {e}")
+                raise
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
+    def table_exists(self, table_name):
+        with self.connection() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)
+            ).fetchone()
+            return row is not None
+
+    def iter_users(self, columns, pending_only=False, itersize=None):
+        """
+        Stránkování podle id jako u PostgresBackend – mezi stránkami se nedrží čtecí
+        transakce, která by bránila checkpointu WAL.
+        """
+        query = f'''
+            SELECT id, {", ".join(_user_columns(columns))} FROM user_data
+            WHERE id > ? {"AND processed_at IS NULL" if pending_only else ""}
+            ORDER BY id
+            LIMIT ?
+        '''
+        itersize = itersize or DB_ITERSIZE
+        last_id = 0
+        while True:
+            with self.connection() as conn:
+                rows = conn.execute(query, (last_id, itersize)).fetchall()
+            for row in rows:
+                yield row[1:]
+            if len(rows) < itersize:
+                return
+            last_id = rows[-1][0]
+
+    def initialize_database(self):
+        """
+        Inicializuje databázi vytvořením tabulky user_data se sloupci:
+        id, email, token, email_domain,
+        social_media, school, sports, other, processed_at
+        a tabulky tracking_events pro záznamy z formuláře.
+        """
+        try:
+            with self.connection() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS user_data (
+                        id INTEGER PRIMARY KEY,
+                        email TEXT NOT NULL UNIQUE,
+                        token TEXT,
+                        email_domain TEXT,
+                        social_media TEXT,
+                        school TEXT,
+                        sports TEXT,
+                        other TEXT,
+                        processed_at TEXT
+                    );
+                ''')
+                self._create_token_index(conn)
+                self._create_processing_columns(conn)
+                self._create_tracking_table(conn)
+                conn.commit()
+                print("✅ Databáze byla úspěšně inicializována.")
+        except Exception as e:
+            print(f"❌ Chyba při inicializaci databáze: {e}")
+
+    def upsert_user(self, email, token=None, email_domain=None,
+                    social_media=None, school=None, sports=None, other=None):
+        """
+        Vloží nový záznam do tabulky user_data nebo aktualizuje existující záznam dle emailu.
+        Aktualizují se sloupce: token, social_media,email_domain, school, sports, other.
+        Vrací True po potvrzeném zápisu, při chybě False.
+        """
+        try:
+            with self.connection() as conn:
+                conn.execute(_UPSERT_USER_SQL, (email, token, email_domain,
+                                                social_media, school, sports, other))
+                conn.commit()
+                print("✅ Data byla úspěšně vložena/aktualizována.")
+                return True
+        except Exception as e:
+            print(f"❌ Chyba při vkládání/aktualizaci dat: {e}")
+        return False
+
+    def register_user(self, email, token):
+        """
+        Zaregistruje nový e-mail s tokenem jediným příkazem (bez předchozího dotazu na existenci).
+        Vrací id nového záznamu, nebo None, pokud už e-mail v databázi je.
+        """
+        try:
+            with self.connection() as conn:
+                cur = conn.execute('''
+                    INSERT INTO user_data (email, token)
+                    VALUES (?, ?)
+                    ON CONFLICT (email) DO NOTHING;
+                ''', (email, token))
+                conn.commit()
+                return cur.lastrowid if cur.rowcount == 1 else None
+        except Exception as e:
+            print(f"❌ Chyba při registraci e-mailu: {e}")
+            raise
+
+    def upsert_users_batch(self, rows):
+        """
+        Dávková varianta upsert_user – celá dávka v jedné zápisové transakci
+        (BEGIN IMMEDIATE, takže se mezi zjištěním existence a zápisem nic nezmění).
+        Výsledky a ošetření chyb jako u PostgresBackend.upsert_users_batch.
+        """
+        rows = list(rows)
+        merged, outcomes = merge_user_rows(rows)
+        if not merged:
+            return outcomes
+
+        try:
+            with self.connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                existing = self._existing_emails(conn, list(merged))
+                values = list(merged.values())
+                for start in range(0, len(values), UPSERT_BATCH_PAGE_SIZE):
+                    conn.executemany(_UPSERT_USER_SQL, values[start:start + UPSERT_BATCH_PAGE_SIZE])
+                conn.commit()
+        except Exception as e:
+            print(f"❌ Chyba při dávkovém vkládání/aktualizaci dat: {e}")
+            return None
+
+        return [
+            outcome or ("updated" if row["email"] in existing else "inserted")
+            for row, outcome in zip(rows, outcomes)
+        ]
+
+    def _existing_emails(self, conn, emails):
+        existing = set()
+        for start in range(0, len(emails), SQLITE_MAX_IN_PARAMS):
+            chunk = emails[start:start + SQLITE_MAX_IN_PARAMS]
+            placeholders = ", ".join("?" * len(chunk))
+            existing.update(
+                row[0] for row in conn.execute(
+                    f"SELECT email FROM user_data WHERE email IN ({placeholders})", chunk
+                )
+            )
+        return existing
+
+    def get_existing_emails(self, emails):
+        """Vrátí množinu e-mailů z daného seznamu, které už jsou v user_data."""
+        if not emails:
+            return set()
+        try:
+            with self.connection() as conn:
+                return self._existing_emails(conn, list(emails))
+        except Exception as e:
+            print(f"❌ Chyba při ověřování existence e-mailů: {e}")
+            raise
+
+    def _create_token_index(self, conn):
+        """Index pro vyhledání uživatele podle tokenu z odkazu ve formuláři."""
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_user_data_token
+            ON user_data (token);
+        ''')
+
+    def initialize_token_index(self):
+        """Vytvoří index user_data.token, pokud ještě neexistuje."""
+        try:
+            with self.connection() as conn:
+                self._create_token_index(conn)
+                conn.commit()
+        except Exception as e:
+            print(f"❌ Chyba při vytváření indexu tokenů: {e}")
+
+    def lookup_user_id(self, token, email=None):
+        with self.connection() as conn:
+            if email is not None:
+                result = conn.execute("SELECT id FROM user_data WHERE email = ? AND token = ?",
+                                      (email, token)).fetchone()
+            else:
+                result = conn.execute("SELECT id FROM user_data WHERE token = ? LIMIT 1", (token,)).fetchone()
+        return result[0] if result else None
+
+    def _create_processing_columns(self, conn):
+        """Sloupec processed_at a částečný index nezpracovaných záznamů (viz PostgresBackend)."""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(user_data)")}
+        if "processed_at" not in columns:
+            conn.execute("ALTER TABLE user_data ADD COLUMN processed_at TEXT;")
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_user_data_unprocessed
+            ON user_data (id) WHERE processed_at IS NULL;
+        ''')
+        conn.execute('''
+            UPDATE user_data SET processed_at = CURRENT_TIMESTAMP
+            WHERE processed_at IS NULL
+              AND (COALESCE(social_media, '') <> '' OR COALESCE(school, '') <> ''
+                   OR COALESCE(sports, '') <> '' OR COALESCE(other, '') <> '');
+        ''')
+
+    def initialize_processing_columns(self):
+        """Doplní do user_data sloupec processed_at a index nezpracovaných záznamů, pokud chybí."""
+        try:
+            with self.connection() as conn:
+                self._create_processing_columns(conn)
+                conn.commit()
+        except Exception as e:
+            print(f"❌ Chyba při inicializaci sloupce processed_at: {e}")
+
+    def iter_pending_users(self, itersize=None):
+        """Proudově vrací e-maily záznamů, které scraper ještě nezpracoval (přes částečný index)."""
+        for row in self.iter_users(("email",), pending_only=True, itersize=itersize):
+            yield row[0]
+
+    def mark_user_processed(self, email):
+        """Označí záznam jako zpracovaný scraperem."""
+        try:
+            with self.connection() as conn:
+                conn.execute("UPDATE user_data SET processed_at = CURRENT_TIMESTAMP WHERE email = ?", (email,))
+                conn.commit()
+        except Exception as e:
+            print(f"❌ Chyba při označení záznamu jako zpracovaného: {e}")
+
+    def _create_tracking_table(self, conn):
+        """Tabulky tracking_events (čas jako epoch ms) a tracking_counters včetně indexů."""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS tracking_events (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL REFERENCES user_data(id) ON DELETE CASCADE,
+                event_type TEXT NOT NULL CHECK (event_type IN ('link_click', 'submission')),
+                token TEXT,
+                action TEXT NOT NULL,
+                created_at INTEGER NOT NULL,
+                field_mask INTEGER NOT NULL DEFAULT 0,
+                campaign TEXT NOT NULL DEFAULT 'default'
+            );
+        ''')
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(tracking_events)")}
+        if "campaign" not in columns:
+            conn.execute("ALTER TABLE tracking_events ADD COLUMN campaign TEXT NOT NULL DEFAULT 'default';")
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_tracking_events_user_created
+            ON tracking_events (user_id, created_at);
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_tracking_events_action_created
+            ON tracking_events (action, created_at);
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_tracking_events_campaign_user_created
+            ON tracking_events (campaign, user_id, created_at);
+        ''')
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(tracking_counters)")}
+        if columns and "campaign" not in columns:
+            # SQLite neumí změnit primární klíč – čítače z doby před kampaněmi se přesunou
+            # do nové tabulky a patří výchozí kampani
+            conn.execute("ALTER TABLE tracking_counters RENAME TO tracking_counters_legacy;")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS tracking_counters (
+                campaign TEXT NOT NULL DEFAULT 'default',
+                bucket_type TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                action TEXT NOT NULL,
+                clicks INTEGER NOT NULL DEFAULT 0,
+                submissions INTEGER NOT NULL DEFAULT 0,
+                validation_failures INTEGER NOT NULL DEFAULT 0,
+                unique_users INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (campaign, bucket_type, bucket, action)
+            );
+        ''')
+        if columns and "campaign" not in columns:
+            conn.execute('''
+                INSERT INTO tracking_counters (
+                    bucket_type, bucket, action,
+                    clicks, submissions, validation_failures
+                )
+                SELECT bucket_type, bucket, action,
+                       clicks, submissions, validation_failures
+                FROM tracking_counters_legacy;
+            ''')
+            conn.execute("DROP TABLE tracking_counters_legacy;")
+        if columns and "unique_users" not in columns:
+            # Počet uživatelů s kliknutím na akci se u dosavadních čítačů jednou dopočítá
+            if "campaign" in columns:
+                conn.execute("ALTER TABLE tracking_counters ADD COLUMN unique_users INTEGER NOT NULL DEFAULT 0;")
+            conn.execute('''
+                UPDATE tracking_counters SET unique_users = (
+                    SELECT count(*) FROM tracking_counters AS users
+                    WHERE users.bucket_type = 'user' AND users.clicks > 0
+                      AND users.campaign = tracking_counters.campaign
+                      AND users.action = tracking_counters.action
+                )
+                WHERE bucket_type = 'action';
+            ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_tracking_counters_bucket
+            ON tracking_counters (bucket_type, campaign, bucket);
+        ''')
+
+    def initialize_tracking_table(self):
+        """Vytvoří tabulky tracking_events a tracking_counters, pokud ještě neexistují."""
+        try:
+            with self.connection() as conn:
+                self._create_tracking_table(conn)
+                conn.commit()
+        except Exception as e:
+            print(f"❌ Chyba při inicializaci tabulky tracking_events: {e}")
+
+    def insert_tracking_events(self, events, counters=None):
+        """
+        Vloží dávku událostí (user_id, event_type, token, action, epoch ms, field_mask, campaign)
+        a přírůstky čítačů v jedné transakci. Chyby DB se propagují.
+        """
+        if not events:
+            return
+        with self.connection() as conn:
+            conn.executemany('''
+                INSERT INTO tracking_events (
+                    user_id, event_type, token, action,
+                    created_at, field_mask, campaign
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', events)
+            if counters:
+                # Stejně jako u PostgresBackend: z nových součtů čítačů podle uživatele
+                # se pozná první kliknutí a o ně se zvýší unique_users čítačů podle akce
+                user_counters = [row for row in counters if row[1] == "user"]
+                click_totals = [
+                    conn.execute(_UPSERT_COUNTER_SQL + " RETURNING campaign, bucket, action, clicks",
+                                 row).fetchall()[0]
+                    for row in with_unique_users(user_counters, {})
+                ]
+                conn.executemany(_UPSERT_COUNTER_SQL, with_unique_users(
+                    [row for row in counters if row[1] != "user"],
+                    count_first_clicks(user_counters, click_totals)
+                ))
+            conn.commit()
+
+    def get_tracking_events(self, campaign=None):
+        """Vrátí události v pořadí vzniku (stejné n-tice a filtr kampaně jako PostgresBackend)."""
+        where = "WHERE campaign = ?" if campaign is not None else ""
+        params = (campaign,) if campaign is not None else ()
+        try:
+            with self.connection() as conn:
+                return conn.execute(f'''
+                    SELECT user_id, event_type, token, action, created_at, field_mask, campaign
+                    FROM tracking_events
+                    {where}
+                    ORDER BY created_at, id
+                ''', params).fetchall()
+        except Exception as e:
+            print(f"❌ Chyba při načítání událostí: {e}")
+        return []
+
+    def get_tracking_counters(self, campaign=None):
+        """Vrátí čítače podle akce všech kampaní, nebo jen jedné (stejné n-tice jako PostgresBackend)."""
+        where = "AND campaign = ?" if campaign is not None else ""
+        try:
+            with self.connection() as conn:
+                return conn.execute(f'''
+                    SELECT campaign, action,
+                           clicks, submissions, validation_failures, unique_users
+                    FROM tracking_counters
+                    WHERE bucket_type = 'action' {where}
+                ''', (campaign,) if campaign is not None else ()).fetchall()
+        except Exception as e:
+            print(f"❌ Chyba při načítání čítačů: {e}")
+        return []
+
+    def get_tracking_buckets(self, bucket_type, campaign=None, offset=0, limit=100):
+        """Stránka rozpisu čítačů podle uživatele nebo hodiny (stejné n-tice jako PostgresBackend)."""
+        where = "AND campaign = ?" if campaign is not None else ""
+        params = [bucket_type, bucket_type] + ([campaign] if campaign is not None else []) + [limit, offset]
+        try:
+            with self.connection() as conn:
+                return conn.execute(f'''
+                    SELECT campaign, bucket, action,
+                           clicks, submissions, validation_failures
+                    FROM tracking_counters
+                    WHERE bucket_type = ? AND (campaign, bucket) IN (
+                        SELECT DISTINCT campaign, bucket
+                        FROM tracking_counters
+                        WHERE bucket_type = ? {where}
+                        ORDER BY campaign, bucket
+                        LIMIT ? OFFSET ?
+                    )
+                    ORDER BY campaign, bucket, action
+                ''', params).fetchall()
+        except Exception as e:
+            print(f"❌ Chyba při načítání čítačů: {e}")
+        return []
+
+    def purge_tracking_events(self, retention_days=None):
+        """Retence bez partition – staré události se smažou jedním příkazem DELETE."""
+        if retention_days is None:
+            retention_days = TRACKING_RETENTION_DAYS
+        cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+        try:
+            with self.connection() as conn:
+                deleted = conn.execute(
+                    "DELETE FROM tracking_events WHERE created_at < ?", (int(cutoff.timestamp() * 1000),)
+                ).rowcount
+                conn.commit()
+        except Exception as e:
+            print(f"❌ Chyba při mazání starých událostí: {e}")
+            return [], 0
+        print(f"✅ Smazáno starých událostí: {deleted}.")
+        return [], deleted
@@ -0,0 +1,23 @@
+"""
+Retence událostí z formulářů (DB_BACKEND postgres / sqlite).
+
+U PostgreSQL odpojí a zahodí celé měsíční partition tracking_events starší
+než zadaný počet dní (bez mazání po řádcích, každá v krátké vlastní transakci),
+u SQLite smaže staré řádky. --days 0 smaže vše kromě probíhajícího měsíce
+(partition), resp. všechny dosavadní řádky. Čítače pro /stats zůstávají.
+Vhodné spouštět pravidelně, např. denně z cronu.
+
+Spuštění (ze složky software):
+    python purge_tracking.py [--days 365]
+"""
+import argparse
+from database import purge_tracking_events, TRACKING_RETENTION_DAYS
+
+def main():
+    parser = argparse.ArgumentParser(description="Smaže události starší než zadaný počet dní.")
+    parser.add_argument("--days", type=int, default=TRACKING_RETENTION_DAYS)
+    args = parser.parse_args()
+    purge_tracking_events(args.days)
+
+if __name__ == "__main__":
+    main()
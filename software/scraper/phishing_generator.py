@@ -3,11 +3,13 @@ import torch
 from transformers import GPT2LMHeadModel, GPT2Tokenizer, pipeline
 from dotenv import load_dotenv
 from huggingface_hub import snapshot_download
-from database import get_db_connection
+from database import iter_users, DEFAULT_CAMPAIGN
 
 # Načtení environment proměnných
 load_dotenv()
 HF_TOKEN = os.getenv("HF_TOKEN")
+# Kampaň (vlna rozesílky), do které se počítají kliknutí z vygenerovaných e-mailů
+PHISHING_CAMPAIGN = os.getenv("PHISHING_CAMPAIGN", DEFAULT_CAMPAIGN)
 
 # Cesta k modelu
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -35,19 +37,14 @@ llm = pipeline("text-generation", model=model, tokenizer=tokenizer, device=-1)
 
 
 def get_users():
-    """Načte uživatele a jejich data z databáze."""
-    conn = get_db_connection()
-    if not conn:
-        print("Nepodařilo se připojit k databázi.")
-        return []
+    """
+    Proudově načítá uživatele a jejich data z databáze po stránkách podle id –
+    generování textu je pomalé, takže se mezi stránkami nedrží spojení ani transakce.
+    """
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT email, token, social_media, school, sports, other FROM user_data")
-        users = cur.fetchall()
-        cur.close()
-        return users
-    finally:
-        conn.close()
+        yield from iter_users(("email", "token", "social_media", "school", "sports", "other"))
+    except Exception as e:
+        print(f"Nepodařilo se načíst uživatele z databáze: {e}")
 
 def extract_subject(text):
     # Extrahuje subjekt z generovaného textu (např. první věta)
@@ -77,7 +74,7 @@ def generate_phishing_email(token, social_media, school, sports, other):
     opening_paragraph = extract_opening_paragraph(response_intro)
 
     # URL phishingového formuláře
-    phishing_form_url = f"http://localhost:5001/form?token={token}"
+    phishing_form_url = f"http://localhost:5001/form?token={token}&campaign={PHISHING_CAMPAIGN}"
 
     # Následně generuj tělo e-mailu
     prompt_body = f"""
@@ -97,16 +94,16 @@ def generate_phishing_email(token, social_media, school, sports, other):
     return generated_mail
 
 def main():
-    users = get_users()
-    if not users:
-        print("Žádní uživatelé nebyli nalezeni v databázi.")
-        return
-
-    for user in users:
+    processed = 0
+    for user in get_users():
         email, token, social_media, school, sports, other = user
         
         phishing_email = generate_phishing_email(token, social_media, school, sports, other)
         print(f"\nPhishing e-mail pro {email}:\n{phishing_email}\n")
+        processed += 1
+
+    if not processed:
+        print("Žádní uživatelé nebyli nalezeni v databázi.")
 
 if __name__ == "__main__":
     main()
@@ -12,7 +12,7 @@ from bs4 import BeautifulSoup
 from duckduckgo_search import DDGS
 from transformers import AutoModelForSequenceClassification, AutoTokenizer, pipeline
 from dotenv import load_dotenv
-from database import get_db_connection, upsert_user
+from database import upsert_user, initialize_processing_columns, iter_pending_users, mark_user_processed
 import torch
 
 #___________________________________________________________________________________________________________________
@@ -455,6 +455,7 @@ def analyze_page_content(url, driver):
 
 # Vyhledání informací na DuckDuckGo
 def search_duckduckgo(query):
+    """Odkazy nalezené pro dotaz; při chybě vyhledávání None (na rozdíl od prázdného výsledku)."""
     try:
         time.sleep(random.uniform(3, 8))  # Náhodná pauza mezi 3–8 sekundami
         with DDGS() as ddgs:
@@ -464,7 +465,7 @@ def search_duckduckgo(query):
         return list(results)
     except Exception as e:
         print(f'Error during DuckDuckGo search: {e}')
-        return []
+        return None
 
 # Vytvoření variant jmen pro vyhledávání
 def generate_name_variants(extracted_name):
@@ -511,43 +512,26 @@ def contains_name(page_text, extracted_name):
 #                                                 DATABASE ACCESS
 #___________________________________________________________________________________________________________________
 
-def get_all_users():
+def get_pending_users():
     """
-    Načte všechny záznamy z tabulky user_data.
-    Vrací seznam řádků s hodnotami: email, social_media, school, sports, other.
+    Proudově načítá e-maily záznamů z user_data, které scraper ještě nezpracoval.
+    Zpracované záznamy filtruje už databáze (processed_at IS NULL, částečný index).
     """
-    conn = get_db_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute("SELECT email, social_media, school, sports, other FROM user_data")
-            rows = cur.fetchall()
-            cur.close()
-            conn.close()
-            return rows
-        except Exception as e:
-            print(f"Chyba při načítání uživatelů: {e}")
-            return []
-    return []
+    try:
+        initialize_processing_columns()
+        yield from iter_pending_users()
+    except Exception as e:
+        print(f"Chyba při načítání uživatelů: {e}")
 
 
 #___________________________________________________________________________________________________________________
 #                                                       MAIN
 #___________________________________________________________________________________________________________________
 def main():
-    # Načtení všech uživatelů z databáze (tabulka user_data)
-    users = get_all_users()
-    if not users:
-        print("V databázi nebyl nalezen žádný záznam.")
-        return
-    
-
-    for user in users:
-        email, social_media, school, sports, other = user
-        # Pokud již má alespoň jeden ze sloupců data ze scraperu, přeskočíme tento email
-        if social_media or school or sports or other:
-            print(f"Email {email} již má data ze scraperu. Přeskakuji.")
-            continue
+    # Proudové načítání dosud nezpracovaných uživatelů z databáze (tabulka user_data)
+    users_seen = 0
+    for email in get_pending_users():
+        users_seen += 1
 
         local_part, domain_part = split_email(email)
         domain_info = analyze_domain(domain_part)
@@ -591,8 +575,12 @@ def main():
 
         # Vyhledání informací pomocí DuckDuckGo a uložení s příznakem check_name
         all_urls = {}
+        search_failed = False
         for (q, check_name) in search_queries:
             results = search_duckduckgo(q)
+            if results is None:
+                search_failed = True
+                continue
             for url in results:
                 if url in all_urls:
                     # Pokud se URL již vyskytuje, nová hodnota bude logický součin (pokud jeden dotaz nevyžaduje kontrolu, nastavíme False)
@@ -604,6 +592,10 @@ def main():
         # Nyní zpracujeme každé URL s ohledem na check_name
         if not all_urls:
             print('Nebyla nalezena žádná URL.')
+            # Bez výsledků je záznam hotový (další běh ho znovu neprohledává) – pokud ale
+            # některé vyhledávání selhalo, zkusí se to při dalším běhu znovu
+            if not search_failed:
+                mark_user_processed(email)
             continue
         else:
             results_data = {}
@@ -644,19 +636,25 @@ def main():
             sports_value = "\n".join(sports_results) if sports_results else None
             other_value = "\n".join(other_results) if other_results else None
 
-            # Uložíme všechna nalezená data do databáze
-            upsert_user(email,
-                        email_domain=domain_part,
-                        social_media=social_media_value,
-                        school=school_value,
-                        sports=sports_value,
-                        other=other_value)
+            # Uložíme všechna nalezená data do databáze; zpracovaný je záznam až po potvrzeném zápisu
+            if not upsert_user(email,
+                               email_domain=domain_part,
+                               social_media=social_media_value,
+                               school=school_value,
+                               sports=sports_value,
+                               other=other_value):
+                print(f"Data pro {email} se nepodařilo uložit, záznam zůstává ke zpracování.")
+                continue
+            mark_user_processed(email)
             print(f"Databáze aktualizována pro {email} s kategoriemi:")
             print("Social media:", social_media_value)
             print("School:", school_value)
             print("Sports:", sports_value)
             print("Other:", other_value)
 
+    if not users_seen:
+        print("V databázi nebyl nalezen žádný nezpracovaný záznam.")
+
 
 if __name__ == "__main__":
     load_dotenv()
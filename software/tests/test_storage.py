@@ -0,0 +1,201 @@
+"""
+Testy JSON úložiště událostí (web_api/storage.py): přehrání logu,
+kompakce do snapshotu a zotavení po pádu procesu.
+
+Spuštění (ze složky software):
+    python -m pytest -q tests
+"""
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, "web_api"))
+
+import storage  # noqa: E402
+
+FIELDS = storage.ACTION_FIELDS["b5p"]
+ALL_TRUE = {field: True for field in FIELDS}
+
+
+class JsonStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.saved = {
+            name: getattr(storage, name)
+            for name in ("TRACKING_BACKEND", "JSON_DB_PATH", "EVENT_LOG_PATH",
+                         "STATS_PATH", "LOCK_PATH", "SNAPSHOT_MIN_BYTES")
+        }
+        storage.TRACKING_BACKEND = "json"
+        storage.JSON_DB_PATH = os.path.join(self.tmp_dir, "form_data.json")
+        storage.EVENT_LOG_PATH = os.path.join(self.tmp_dir, "form_events.jsonl")
+        storage.STATS_PATH = os.path.join(self.tmp_dir, "form_stats.json")
+        storage.LOCK_PATH = os.path.join(self.tmp_dir, "form_events.lock")
+        storage.SNAPSHOT_MIN_BYTES = 1024 * 1024
+        self.reset_stats_cache()
+
+    def tearDown(self):
+        storage.flush_tracking_events()
+        for name, value in self.saved.items():
+            setattr(storage, name, value)
+        self.reset_stats_cache()
+        shutil.rmtree(self.tmp_dir)
+
+    def reset_stats_cache(self):
+        # Čítače se v procesu cachují – nový proces začíná od souborů na disku
+        storage._stats_cache.update(log_id=None, offset=0, stats=None)
+
+    def write(self, events):
+        """Zapíše (user_id, odesláno) přes frontu a počká na flusher."""
+        for user_id, submitted in events:
+            if submitted:
+                storage.append_user_submission(user_id, f"token-{user_id}", "b5p", ALL_TRUE)
+            else:
+                storage.log_link_click(user_id, f"token-{user_id}", "b5p")
+        self.assertTrue(storage.flush_tracking_events(timeout=10))
+
+    def actions(self):
+        return storage.get_stats()["actions"]["b5p"]
+
+    def test_replay_pairs_submission_with_click(self):
+        self.write([(1, False), (1, True), (2, False)])
+
+        users = storage.load_json_data()["users"]
+        self.assertEqual(len(users["1"]), 1)
+        self.assertTrue(users["1"][0]["submitted"])
+        self.assertFalse(users["1"][0]["validation_failed"])
+        self.assertEqual(users["2"][0]["submitted"], False)
+        self.assertFalse(os.path.exists(storage.JSON_DB_PATH))
+
+        actions = self.actions()
+        self.assertEqual((actions["clicks"], actions["submissions"], actions["unique_users"]), (2, 1, 2))
+
+    def test_compaction_preserves_data_and_stats(self):
+        self.write([(1, False), (1, True), (2, False)])
+        before = storage.load_json_data()
+        stats_before = self.actions()
+
+        storage.compact_event_log()
+
+        with open(storage.EVENT_LOG_PATH) as f:
+            self.assertEqual(len(f.readlines()), 1)  # jen hlavička nového logu
+        self.reset_stats_cache()
+        self.assertEqual(storage.load_json_data(), before)
+        self.assertEqual(self.actions(), stats_before)
+
+        # Po kompakci se nové události přehrávají nad snapshotem
+        self.write([(2, True), (3, False)])
+        users = storage.load_json_data()["users"]
+        self.assertTrue(users["2"][0]["submitted"])
+        self.assertIn("3", users)
+        self.assertEqual(self.actions()["clicks"], 3)
+
+    def test_compaction_includes_queued_events(self):
+        for user_id in range(5):
+            storage.log_link_click(user_id, f"token-{user_id}", "b5p")
+
+        storage.compact_event_log()
+
+        with open(storage.JSON_DB_PATH) as f:
+            self.assertEqual(len(json.load(f)["campaigns"]["default"]), 5)
+
+    def test_stats_cache_follows_swapped_log(self):
+        self.write([(1, False), (2, False)])
+        self.assertEqual(self.actions()["clicks"], 2)  # offset v cache ukazuje na konec logu
+
+        # Log vymění kompakce (jako v jiném workeru); starý offset v novém logu
+        # ukazuje doprostřed řádku s delší událostí
+        storage.compact_event_log()
+        self.write([(1000 + user_id, user_id % 2 == 1) for user_id in range(10)])
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            actions = self.actions()
+        self.assertNotIn("Přeskakuji", output.getvalue())
+        self.assertEqual((actions["clicks"], actions["submissions"]), (7, 5))
+
+    def test_log_compacts_automatically_past_threshold(self):
+        storage.SNAPSHOT_MIN_BYTES = 4096
+        self.write([(user_id % 50, user_id % 2 == 1) for user_id in range(400)])
+
+        self.assertTrue(os.path.exists(storage.JSON_DB_PATH))
+        self.assertLess(os.path.getsize(storage.EVENT_LOG_PATH), 8192)
+        self.reset_stats_cache()
+        self.assertEqual(self.actions()["clicks"] + self.actions()["submissions"], 400)
+
+    def test_truncated_log_tail_is_repaired(self):
+        self.write([(1, False), (2, False)])
+        with open(storage.EVENT_LOG_PATH, 'a') as f:
+            f.write('["c","3",17')  # neúplný zápis přerušený pádem
+
+        storage.initialize_form_data()
+
+        with open(storage.EVENT_LOG_PATH) as f:
+            self.assertTrue(f.read().endswith('\n'))
+        self.assertEqual(sorted(storage.load_json_data()["users"]), ["1", "2"])
+        self.write([(3, False)])
+        self.assertEqual(sorted(storage.load_json_data()["users"]), ["1", "2", "3"])
+
+    def test_leftover_tmp_files_are_removed(self):
+        self.write([(1, False)])
+        for path in (storage.JSON_DB_PATH, storage.STATS_PATH):
+            with open(path + '.tmp', 'w') as f:
+                f.write('{"nedokonč')
+
+        storage.initialize_form_data()
+
+        self.assertFalse(os.path.exists(storage.JSON_DB_PATH + '.tmp'))
+        self.assertFalse(os.path.exists(storage.STATS_PATH + '.tmp'))
+        self.assertIn("1", storage.load_json_data()["users"])
+
+    def test_crash_before_log_swap_does_not_replay_twice(self):
+        self.write([(1, False), (1, True), (2, False)])
+        old_log = storage.EVENT_LOG_PATH + '.old'
+        shutil.copyfile(storage.EVENT_LOG_PATH, old_log)
+        before = storage.load_json_data()
+        stats_before = self.actions()
+
+        storage.compact_event_log()
+        # Pád po uložení snapshotu a čítačů, ale před výměnou logu
+        os.replace(old_log, storage.EVENT_LOG_PATH)
+        with open(storage.JSON_DB_PATH) as f:
+            self.assertIsNotNone(json.load(f)["log_id"])
+
+        self.reset_stats_cache()
+        self.assertEqual(storage.load_json_data(), before)
+        self.assertEqual(self.actions(), stats_before)
+
+        storage.compact_event_log()
+        self.reset_stats_cache()
+        self.assertEqual(storage.load_json_data(), before)
+        self.assertEqual(self.actions(), stats_before)
+
+    def test_crash_after_stats_save_does_not_count_twice(self):
+        self.write([(1, False), (1, True)])
+        storage.compact_event_log()
+        self.write([(2, False), (2, True), (3, False)])
+        old_snapshot, old_log = storage.JSON_DB_PATH + '.old', storage.EVENT_LOG_PATH + '.old'
+        shutil.copyfile(storage.JSON_DB_PATH, old_snapshot)
+        shutil.copyfile(storage.EVENT_LOG_PATH, old_log)
+        before = storage.load_json_data()
+        stats_before = self.actions()
+
+        storage.compact_event_log()
+        # Pád po uložení čítačů, ale před uložením snapshotu
+        os.replace(old_snapshot, storage.JSON_DB_PATH)
+        os.replace(old_log, storage.EVENT_LOG_PATH)
+
+        storage.compact_event_log()
+        self.reset_stats_cache()
+        self.assertEqual(storage.load_json_data(), before)
+        self.assertEqual(self.actions(), stats_before)
+
+
+if __name__ == "__main__":
+    unittest.main()
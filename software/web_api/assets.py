@@ -0,0 +1,128 @@
+"""
+Statické soubory s otiskem obsahu v názvu (např. style.3f9a0c1b2d4e.css).
+
+Při startu se soubory ze static/ načtou do paměti, spočítá se jim otisk
+(SHA-256) a textové soubory se předkomprimují (gzip a brotli, je-li
+nainstalován balíček Brotli). Šablony odkazují přes asset_url(), takže nový
+obsah dostane i novou URL a odpověď smí zůstat v cache prohlížeče natrvalo
+(Cache-Control: immutable) – po první návštěvě se pro ni na server už
+nechodí. Route /assets/<název> zaregistruje register_assets(app).
+Původní /static/ zůstává kvůli starým odkazům.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+try:
+    import brotli
+except ImportError:  # bez Brotli se posílá jen gzip
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+ASSETS_URL = '/assets'
+# Rok – obsah na URL s otiskem se nikdy nezmění
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Přípony, které se vyplatí komprimovat (webp a jpg už komprimované jsou)
+COMPRESSIBLE_SUFFIXES = {".css", ".js", ".svg", ".ico"}
+_CSS_URL_PATTERN = re.compile(r"""url\((['"]?)([^'")]+)\1\)""")
+
+# název s otiskem -> {"body", "type", "etag", "encodings": {"br": bytes, "gzip": bytes}}
+_assets = {}
+# původní název -> název s otiskem
+_manifest = {}
+
+def _rewrite_css_urls(css):
+    """Přepíše url(...) na soubory ze static/ na názvy s otiskem (leží ve stejné složce)."""
+    def replace(match):
+        quote, target = match.group(1), match.group(2)
+        return f"url({quote}{_manifest.get(target, target)}{quote})"
+    return _CSS_URL_PATTERN.sub(replace, css)
+
+def load_assets(static_dir=STATIC_DIR):
+    """Načte, otiskne a předkomprimuje soubory ze static_dir (jednou při startu procesu)."""
+    _assets.clear()
+    _manifest.clear()
+    # CSS až nakonec – odkazuje na názvy ostatních souborů už s otiskem
+    for name in sorted(os.listdir(static_dir), key=lambda name: (name.endswith(".css"), name)):
+        path = os.path.join(static_dir, name)
+        if not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as f:
+            body = f.read()
+        if name.endswith(".css"):
+            body = _rewrite_css_urls(body.decode("utf-8")).encode("utf-8")
+
+        digest = hashlib.sha256(body).hexdigest()[:12]
+        stem, suffix = os.path.splitext(name)
+        encodings = {}
+        if suffix in COMPRESSIBLE_SUFFIXES:
+            if brotli is not None:
+                encodings["br"] = brotli.compress(body, quality=11)
+            encodings["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            # Komprese, která nic neušetří, se nepoužije
+            encodings = {encoding: data for encoding, data in encodings.items() if len(data) < len(body)}
+
+        hashed_name = f"{stem}.{digest}{suffix}"
+        _assets[hashed_name] = {
+            "body": body,
+            "type": mimetypes.guess_type(name)[0] or "application/octet-stream",
+            "etag": digest,
+            "encodings": encodings,
+        }
+        _manifest[name] = hashed_name
+
+def register_assets(app):
+    """
+    Zaregistruje v aplikaci (Flask i Quart) route GET /assets/<název s otiskem>
+    a zpřístupní šablonám funkci asset_url; soubory načte při prvním volání.
+    """
+    if not _assets:
+        load_assets()
+    app.jinja_env.globals["asset_url"] = asset_url
+
+    from flask import Flask
+    if isinstance(app, Flask):
+        from flask import request
+
+        def asset(name):
+            """Statický soubor s otiskem obsahu v názvu – prohlížeč ho drží v cache natrvalo."""
+            return asset_response(name, request)
+    else:
+        # Quart – odpověď je celá v paměti, view nic nečeká
+        from quart import request
+
+        async def asset(name):
+            """Statický soubor s otiskem obsahu v názvu – prohlížeč ho drží v cache natrvalo."""
+            return asset_response(name, request)
+
+    app.add_url_rule(f"{ASSETS_URL}/<name>", "asset", asset)
+
+def asset_url(name):
+    """URL souboru ze static/ s otiskem obsahu."""
+    return f"{ASSETS_URL}/{_manifest[name]}"
+
+def asset_response(hashed_name, request):
+    """
+    Odpověď na GET /assets/<název s otiskem> jako (tělo, status, hlavičky) pro Flask i Quart.
+    Podle Accept-Encoding vybere předkomprimovanou variantu, na shodné If-None-Match vrátí 304.
+    """
+    asset = _assets.get(hashed_name)
+    if asset is None:
+        return "Soubor nenalezen.", 404, {}
+
+    body, etag = asset["body"], asset["etag"]
+    headers = {"Content-Type": asset["type"], "Cache-Control": ASSET_CACHE_CONTROL}
+    if asset["encodings"]:
+        headers["Vary"] = "Accept-Encoding"
+        for encoding in ("br", "gzip"):
+            if encoding in asset["encodings"] and request.accept_encodings[encoding]:
+                body = asset["encodings"][encoding]
+                etag = f"{etag}-{encoding}"
+                headers["Content-Encoding"] = encoding
+                break
+    headers["ETag"] = f'"{etag}"'
+
+    if request.if_none_match.contains_weak(etag):
+        return b"", 304, headers
+    return body, 200, headers
@@ -0,0 +1,126 @@
+"""
+ASGI verze dynamic_form (Quart) – stejné chování jako dynamic_form.py.
+Dohledání tokenu jde přes database_async (asyncpg), takže čekání na databázi
+nedrží vlákno a jeden proces zvládne tisíce souběžných kliknutí. Události
+se zařadí do fronty storage.py (z vlákna mimo event loop, protože při plné
+frontě se může čekat) a zapisují se dávkově na pozadí.
+
+Spuštění (ze složky software/web_api):
+    hypercorn dynamic_form_async:app --bind 0.0.0.0:5001
+"""
+import asyncio
+import os
+from quart import Quart, request, render_template, jsonify
+from dotenv import load_dotenv
+from database import initialize_token_index
+from database_async import resolve_user_id, get_pool, close_pool
+from tokens import verify_token
+from validators import is_valid_campaign
+from pages import (
+    FORM_TEMPLATE, TOKEN_SLOT, CAMPAIGN_SLOT, evaluate_submission, form_context,
+    is_fetch_request, page_args, precompile_templates, split_form_page, fill_form_page
+)
+from assets import register_assets
+from storage import (
+    initialize_form_data, append_user_submission, log_link_click,
+    get_stats, get_stats_breakdown, STATS_BREAKDOWNS, STATS_PAGE_SIZE, STATS_PAGE_MAX,
+    flush_tracking_events, ACTION_FIELDS, DEFAULT_CAMPAIGN
+)
+
+load_dotenv()
+
+app = Quart(__name__)
+app.secret_key = os.getenv("SECRET_KEY")
+register_assets(app)
+precompile_templates(app, FORM_TEMPLATE)
+
+# Předvykreslené stránky formulářů pro GET (plní se při startu)
+FORM_PAGES = {}
+
+@app.before_serving
+async def startup():
+    # Jednorázová inicializace (synchronní DB vrstva) mimo event loop
+    await asyncio.to_thread(initialize_token_index)
+    await asyncio.to_thread(initialize_form_data)
+    await get_pool()
+    async with app.test_request_context("/form"):
+        for action in ACTION_FIELDS:
+            FORM_PAGES[action] = split_form_page(
+                await render_template(FORM_TEMPLATE, **form_context(action, TOKEN_SLOT, CAMPAIGN_SLOT))
+            )
+
+@app.after_serving
+async def shutdown():
+    await asyncio.to_thread(flush_tracking_events)
+    await close_pool()
+
+@app.route('/stats')
+async def stats():
+    """
+    Průběžné čítače (kliknutí, odeslání, chyby validace) pro dashboard –
+    s ?campaign=... jen pro jednu kampaň, jinak součet všech kampaní.
+    """
+    return jsonify(await asyncio.to_thread(get_stats, request.args.get('campaign')))
+
+@app.route('/stats/<breakdown>')
+async def stats_breakdown(breakdown):
+    """
+    Rozpis čítačů podle uživatele (/stats/users) nebo hodiny (/stats/hours)
+    po stránkách (?offset=...&limit=...), volitelně jen pro jednu kampaň (?campaign=...).
+    """
+    if breakdown not in STATS_BREAKDOWNS:
+        return "Neznámý rozpis.", 404
+    page = page_args(request.args, STATS_PAGE_SIZE, STATS_PAGE_MAX)
+    if page is None:
+        return "Neplatné stránkování.", 400
+    return jsonify(await asyncio.to_thread(get_stats_breakdown, breakdown, request.args.get('campaign'), *page))
+
+@app.route('/form', methods=['GET', 'POST'])
+async def form():
+    form_data = await request.form if request.method == 'POST' else None
+    token = request.args.get('token') if request.method == 'GET' else form_data.get('token')
+    action = request.args.get('action') if request.method == 'GET' else form_data.get('action')
+    # Odkazy bez kampaně (rozeslané dříve) patří do výchozí kampaně
+    campaign = (request.args.get('campaign') if request.method == 'GET' else form_data.get('campaign')) \
+        or DEFAULT_CAMPAIGN
+
+    if not token or not action:
+        return "Chybí token nebo akce.", 400
+
+    if not is_valid_campaign(campaign):
+        return "Neplatná kampaň.", 400
+
+    # Podvržené a poškozené tokeny se odmítnou podle podpisu, bez dotazu do DB;
+    # z podepsaného obsahu je e-mail účastníka
+    email = verify_token(token)
+    if email is None:
+        return "Token není platný.", 400
+
+    user_id = await resolve_user_id(token, email)
+    if not user_id:
+        return "Token není platný.", 400
+
+    # GET známé akce: předvykreslená stránka, dosadí se jen token a kampaň.
+    # Zařazení do fronty může při plné frontě (TRACKING_BACKPRESSURE=block) čekat
+    # až TRACKING_BLOCK_TIMEOUT, proto běží mimo event loop
+    if request.method == 'GET' and action in FORM_PAGES:
+        await asyncio.to_thread(log_link_click, user_id, token, action, campaign)
+        return fill_form_page(FORM_PAGES[action], token, campaign)
+
+    message = ""
+    message_color = "green"
+
+    if request.method == 'POST':
+        result = evaluate_submission(action, form_data)
+        if result is None:
+            return "Neznámá akce.", 400
+        field_truth, message, message_color = result
+        await asyncio.to_thread(append_user_submission, user_id, token, action, field_truth, campaign)
+        # Skript stránky přepíše jen element se zprávou
+        if is_fetch_request(request.headers):
+            return jsonify(message=message, message_color=message_color)
+
+    return await render_template(FORM_TEMPLATE, **form_context(action, token, campaign, message, message_color))
+
+if __name__ == '__main__':
+    app.run(host="0.0.0.0", port=5001)
@@ -0,0 +1,64 @@
+"""
+Produkční konfigurace gunicornu pro web_api a dynamic_form (Flask, WSGI).
+
+Spuštění (ze složky software/web_api):
+    gunicorn -c gunicorn.conf.py --bind 0.0.0.0:5000 web_api:app
+    gunicorn -c gunicorn.conf.py --bind 0.0.0.0:5001 dynamic_form:app
+
+Aplikace se načte jednou v masteru (preload_app) a workery ji zdědí forkem.
+Jednorázová příprava (kontrola a inicializace databáze, úložiště událostí)
+běží v hooku on_starting – jednou za nasazení, ne v každém workeru. Pool
+spojení k DB a fronta událostí se po forku zakládají v každém workeru zvlášť.
+
+Počet workerů je shora omezen rozpočtem spojení k DB (DB_CONNECTION_BUDGET):
+workers × DB_POOL_MAX + 1 (master) se do něj musí vejít. Při ladění GUNICORN_WORKERS
+a GUNICORN_THREADS je potřeba rozpočty obou služeb sečíst a porovnat
+s max_connections databáze.
+
+Graceful reload: kill -HUP <master> – nastartují nové workery a staré
+dokončí rozpracované requesty (nejvýše graceful_timeout s). S preload_app
+HUP nenačte nový kód aplikace; nový kód se nasadí přes kill -USR2 <master>
+(nový master vedle starého) a kill -TERM <starý master>, případně se
+preload vypne (GUNICORN_PRELOAD=0).
+"""
+import importlib
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+
+# Vlákna v každém workeru – pomalý klient neblokuje celý proces. Worker tak drží
+# nejvýše threads + 1 spojení k DB (+1 pro zápis událostí na pozadí)
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# Rozpočet spojení k DB pro celou službu (všechny workery). web_api a dynamic_form
+# mají každá svůj, takže součet obou (výchozí 2 × 40) + scraper a správa se musí vejít
+# do max_connections PostgreSQL (výchozí 100)
+DB_CONNECTION_BUDGET = int(os.getenv("DB_CONNECTION_BUDGET", "40"))
+# Pool workeru stačí na všechna jeho vlákna; aplikace se načítá až po konfiguraci,
+# takže database.py si hodnotu přečte z prostředí
+os.environ.setdefault("DB_POOL_MAX", str(threads + 1))
+connections_per_worker = int(os.environ["DB_POOL_MAX"])
+
+# Procesy: výchozí 2 × jádra + 1 (requesty čekají hlavně na DB a síť),
+# nejvýše však tolik, kolik dovolí rozpočet spojení (jedno si po inicializaci drží master)
+max_workers = max(1, (DB_CONNECTION_BUDGET - 1) // connections_per_worker)
+workers = int(os.getenv("GUNICORN_WORKERS", str(min(multiprocessing.cpu_count() * 2 + 1, max_workers))))
+if workers > max_workers:
+    print(f"⚠️ GUNICORN_WORKERS={workers} × {connections_per_worker} spojení přesahuje "
+          f"DB_CONNECTION_BUDGET={DB_CONNECTION_BUDGET}, spouštím {max_workers} workerů.")
+    workers = max_workers
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+# Prohlížeč po kliknutí dotahuje styly, favicon a odeslání formuláře stejným spojením
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+def on_starting(server):
+    """Jednorázová inicializace aplikace (funkce initialize v jejím modulu) v masteru, před workery."""
+    module = importlib.import_module(server.app.app_uri.split(":")[0])
+    initialize = getattr(module, "initialize", None)
+    if initialize is not None:
+        initialize()
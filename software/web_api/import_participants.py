@@ -0,0 +1,102 @@
+"""
+Hromadný import účastníků, jejichž souhlas byl získán mimo web_api.
+
+CSV se čte proudově (bez načtení celého souboru do paměti). Očekává se sloupec
+"email", volitelně další sloupce user_data (email_domain, social_media, school,
+sports, other); soubor bez hlavičky = e-mail v prvním sloupci. Neplatné adresy
+se přeskočí, novým účastníkům se vygeneruje podepsaný token (jeden sdílený
+serializer), existujícím se token nemění. Zapisuje se po dávkách přes
+upsert_users_batch.
+
+Spuštění (ze složky software/web_api):
+    python import_participants.py ucastnici.csv --batch-size 5000
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from database import upsert_users_batch, get_existing_emails, initialize_database, USER_COLUMNS
+from tokens import generate_token
+from validators import is_valid_email
+
+def read_rows(file, delimiter):
+    """Generuje slovníky se sloupci USER_COLUMNS z CSV (s hlavičkou i bez ní)."""
+    reader = csv.reader(file, delimiter=delimiter)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = [column.strip().lower() for column in header]
+    if "email" not in columns:
+        # Bez hlavičky – první řádek jsou už data
+        columns = ["email"]
+        if header:
+            yield {"email": header[0].strip()}
+    for values in reader:
+        if not values:
+            continue
+        row = {
+            column: value.strip() or None
+            for column, value in zip(columns, values)
+            if column in USER_COLUMNS and column != "token"
+        }
+        row["email"] = (row.get("email") or "").strip()
+        yield row
+
+def write_batch(batch, totals):
+    emails = [row["email"] for row in batch]
+    existing = get_existing_emails(emails)
+    for row in batch:
+        if row["email"] not in existing:
+            row["token"] = generate_token(row["email"])
+        if not row.get("email_domain"):
+            row["email_domain"] = row["email"].split("@", 1)[1]
+    outcomes = upsert_users_batch(batch)
+    if outcomes is None:
+        raise RuntimeError("Dávku se nepodařilo zapsat.")
+    for outcome in outcomes:
+        totals[outcome] += 1
+
+def print_progress(file, file_size, processed, start):
+    elapsed = time.perf_counter() - start
+    percent = file.buffer.tell() / file_size * 100 if file_size else 100
+    rate = processed / elapsed if elapsed else 0
+    print(f"\r⏳ {percent:5.1f} % | {processed} řádků | {rate:.0f} řádků/s", end="", file=sys.stderr, flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Hromadný import účastníků se souhlasem z CSV.")
+    parser.add_argument("csv_path")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--delimiter", default=",")
+    args = parser.parse_args()
+
+    initialize_database()
+
+    totals = {"inserted": 0, "updated": 0, "merged": 0, "invalid": 0}
+    file_size = os.path.getsize(args.csv_path)
+    processed = 0
+    batch = []
+    start = time.perf_counter()
+    with open(args.csv_path, newline="", encoding="utf-8-sig") as file:
+        for row in read_rows(file, args.delimiter):
+            processed += 1
+            if not is_valid_email(row["email"]):
+                totals["invalid"] += 1
+                continue
+            batch.append(row)
+            if len(batch) >= args.batch_size:
+                write_batch(batch, totals)
+                batch = []
+                print_progress(file, file_size, processed, start)
+        if batch:
+            write_batch(batch, totals)
+        print_progress(file, file_size, processed, start)
+    elapsed = time.perf_counter() - start
+
+    print(file=sys.stderr)
+    print(f"✅ Zpracováno {processed} řádků za {elapsed:.2f} s ({processed / elapsed if elapsed else 0:.0f} řádků/s)")
+    print(f"   nových: {totals['inserted']}, aktualizovaných: {totals['updated']}, "
+          f"duplicitních v souboru: {totals['merged']}, neplatných: {totals['invalid']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Obsah stránek sdílený synchronními (Flask) a ASGI (Quart) verzemi web_api a dynamic_form:
+šablony stránek (templates/), jejich kontext a vyhodnocení odeslaných polí.
+"""
+import re
+from markupsafe import escape
+from validators import is_valid_email
+
+# Šablony ve složce templates/ – aplikace je zkompilují jednou při startu (precompile_templates),
+# každý request pak jen vyplní kontext (token, akce, zpráva)
+INDEX_TEMPLATE = "index.html"
+FORM_TEMPLATE = "form.html"
+
+def precompile_templates(app, *template_names):
+    """Načte a zkompiluje šablony do cache Jinja prostředí aplikace (Flask i Quart)."""
+    for template_name in template_names:
+        app.jinja_env.get_template(template_name)
+
+# Kontrola souhlasu
+def has_consent(consent):
+    return consent is not None
+
+def registration_error(email, consent):
+    """Zpráva a barva pro neplatnou registraci; pro platnou ("", "")."""
+    if not has_consent(consent) and not is_valid_email(email):
+        return "Pro zapsání e-mailu do databáze <strong>zaškrtněte souhlas</strong> a <strong>zadejte email ve tvaru</strong>: 'example@example.smt'", "red"
+    elif not has_consent(consent):
+        return "Pro zapsání e-mailu do databáze <strong>zaškrtněte souhlas</strong>.", "red"
+    elif not is_valid_email(email):
+        return "Zadejte prosím pouze <strong>e-mailovou adresu ve tvaru</strong>: 'example@example.smt'", "red"
+    return "", ""
+
+def is_strong_password(password):
+    if len(password) < 12:
+        return False
+    if not re.search(r"[A-Z]", password):
+        return False
+    if not re.search(r"[0-9]", password):
+        return False
+    if not re.search(r"[!@#$%^&*(),.?\":{}|<>]", password):
+        return False
+    return True
+
+def get_title(action):
+    return {
+        'a1z': 'Změna hesla',
+        'b5p': 'Podpisový formulář',
+        'c9d': 'Ověření zařízení'
+    }.get(action, 'Formulář')
+
+def evaluate_submission(action, form):
+    """
+    Vyhodnotí odeslaný formulář dané akce.
+    Vrací (field_truth, message, message_color), pro neznámou akci None.
+    """
+    def get_bool(name): return bool(form.get(name, '').strip())
+    message = ""
+    message_color = "green"
+
+    if action == 'a1z':
+        new_password = form.get("new_password", "")
+        field_truth = {
+            "login": get_bool("login"),
+            "old_password": get_bool("old_password"),
+            "new_password": bool(new_password)
+        }
+        required_fields = {k: v for k, v in field_truth.items()}  # všechno je povinné
+        if not all(required_fields.values()):
+            message_color = "red"
+            message = "Změna hesla neproběhla – vyplňte všechna povinná pole (*)."
+        elif new_password and not is_strong_password(new_password):
+            message_color = "red"
+            message = "Nové heslo musí mít alespoň 12 znaků, obsahovat velké písmeno, číslo a speciální znak."
+        else:
+            message_color = "green"
+            message = "Heslo bylo úspěšně změněno."
+
+
+    elif action == 'b5p':
+        field_truth = {
+            "first_name": get_bool("first_name"),
+            "last_name": get_bool("last_name"),
+            "position": get_bool("position"),
+            "department": get_bool("department"),
+            "phone": get_bool("phone"),
+            "linkedin": get_bool("linkedin"),
+            "consent": get_bool("consent")
+        }
+        required_fields = {k: v for k, v in field_truth.items() if k != "linkedin"}  # linkedin ignorujeme
+        if not field_truth["consent"]:
+            message_color = "red"
+            message = "Pro pokračování je třeba potvrdit souhlas se zpracováním údajů."
+        elif not all(required_fields.values()):
+            message_color = "red"
+            message = "Podpisové údaje nebyly kompletní – zkontrolujte vyplnění povinných polí (*)."
+        else:
+            message_color = "green"
+            message = "Podpis byl aktualizován."
+
+
+    elif action == 'c9d':
+        field_truth = {
+            "login": get_bool("login"),
+            "password": get_bool("password"),
+            "device_name": get_bool("device_name"),
+            "approve_device": get_bool("approve_device")
+        }
+        required_fields = {k: v for k, v in field_truth.items() if k != "approve_device"}
+        if not field_truth["approve_device"]:
+            message_color = "red"
+            message = "Pro pokračování je třeba potvrdit důvěryhodnost zařízení."
+        elif not all(required_fields.values()):
+            message_color = "red"
+            message = "Zařízení nebylo potvrzeno – vyplňte všechna pole."
+        else:
+            message_color = "green"
+            message = "Zařízení bylo přidáno mezi důvěryhodná."
+
+    else:
+        return None
+
+    return field_truth, message, message_color
+
+def is_fetch_request(headers):
+    """Odeslání skriptem stránky (fetch/XHR posílá X-Requested-With) – stačí odpovědět jen zprávou."""
+    return bool(headers.get("X-Requested-With"))
+
+def page_args(args, default_limit, max_limit):
+    """Stránkování z query parametrů (?offset=&limit=) jako (offset, limit); neplatné hodnoty None."""
+    try:
+        offset = int(args.get("offset", 0))
+        limit = int(args.get("limit", default_limit))
+    except ValueError:
+        return None
+    if offset < 0 or not 0 < limit <= max_limit:
+        return None
+    return offset, limit
+
+def form_context(action, token, campaign, message="", message_color="green"):
+    """Kontext šablony FORM_TEMPLATE pro danou akci."""
+    return {
+        "action": action,
+        "title": get_title(action),
+        "token": token,
+        "campaign": campaign,
+        "message": message,
+        "message_color": message_color,
+    }
+
+# Zástupné hodnoty pro předvykreslení stránky formuláře (v HTML se jinak nevyskytují)
+TOKEN_SLOT = "\x00token\x00"
+CAMPAIGN_SLOT = "\x00campaign\x00"
+_SLOT_PATTERN = re.compile(f"({re.escape(TOKEN_SLOT)}|{re.escape(CAMPAIGN_SLOT)})")
+
+def split_form_page(html):
+    """
+    Rozdělí stránku vykreslenou s kontextem form_context(action, TOKEN_SLOT, CAMPAIGN_SLOT)
+    na statické části a sloty – předvykresluje se jednou při startu.
+    """
+    return _SLOT_PATTERN.split(html)
+
+def fill_form_page(parts, token, campaign):
+    """Doplní do předvykreslené stránky token a kampaň (escapované) – jediné spojení řetězců."""
+    values = {TOKEN_SLOT: escape(token), CAMPAIGN_SLOT: escape(campaign)}
+    return "".join([values.get(part, part) for part in parts])
@@ -1,119 +1,807 @@
 import os
 import json
-from datetime import datetime, timedelta, timezone
-from database import get_db_connection
+import atexit
+import functools
+import gc
+import itertools
+import uuid
+try:
+    import fcntl
+except ImportError:  # Windows – zamyká se jen v rámci procesu
+    fcntl = None
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from database import (
+    DEFAULT_CAMPAIGN, initialize_tracking_table, insert_tracking_events,
+    is_transient_error, get_tracking_events, get_tracking_counters, get_tracking_buckets
+)
 
+# Úložiště událostí: "json" (lokální log + snapshot) nebo "database" (tabulka tracking_events
+# v databázi zvolené DB_BACKEND – PostgreSQL i SQLite)
+TRACKING_BACKEND = os.getenv("TRACKING_BACKEND", "json")
+# Dřívější název hodnoty "database"
+if TRACKING_BACKEND == "postgres":
+    TRACKING_BACKEND = "database"
+
+# Snapshot (čitelný pohled na data pro reporting)
 JSON_DB_PATH = 'form_data.json'
+# Append-only log událostí – jeden JSON záznam na řádek
+EVENT_LOG_PATH = 'form_events.jsonl'
+# Agregované čítače k poslednímu složenému logu (pro /stats)
+STATS_PATH = 'form_stats.json'
+# Zámek sdílený všemi procesy (workery), které zapisují do logu a snapshotu
+LOCK_PATH = 'form_events.lock'
+# Log se složí do snapshotu, až přeroste snapshot (nejméně však tuto velikost),
+# takže cena kompakce na jednu událost zůstává konstantní
+SNAPSHOT_MIN_BYTES = int(os.getenv("SNAPSHOT_MIN_BYTES", str(1024 * 1024)))
+# Odeslání formuláře se páruje s kliknutím nejvýše 10 minut starým
+SUBMISSION_WINDOW_MS = 10 * 60 * 1000
+
+# Pevné pořadí polí formulářů – i-tý bit masky odpovídá i-tému poli
+ACTION_FIELDS = {
+    "a1z": ["login", "old_password", "new_password"],
+    "b5p": ["first_name", "last_name", "position", "department", "phone", "linkedin", "consent"],
+    "c9d": ["login", "password", "device_name", "approve_device"]
+}
+# Pole, která se nepočítají do validace (nepovinná)
+OPTIONAL_FIELDS = {"linkedin"}
+REQUIRED_MASKS = {
+    action: sum(1 << i for i, field in enumerate(fields) if field not in OPTIONAL_FIELDS)
+    for action, fields in ACTION_FIELDS.items()
+}
+
+# Kompaktní zápis:
+#   událost v logu / frontě: [druh ("c" = kliknutí, "s" = odeslání), user_id, epoch ms, token, akce, maska, kampaň]
+#   záznam ve snapshotu:     [epoch ms, token, akce, odesláno (0/1), maska]
+# Snapshot i čítače jsou rozdělené podle kampaně: {"campaigns": {kampaň: {user_id: [záznamy]}}}.
+# Události a data bez kampaně (starší formát) patří kampani DEFAULT_CAMPAIGN.
+# Na slovníky s názvy polí se převádí až při čtení pro reporting (load_json_data, load_campaign_data).
+CLICK = "c"
+SUBMISSION = "s"
+
+# Write-behind fronta: události se zapisují na pozadí po dávkách, request na zápis nečeká
+TRACKING_QUEUE_SIZE = int(os.getenv("TRACKING_QUEUE_SIZE", "10000"))
+# Maximální počet událostí zapsaných najednou (jeden INSERT / jeden zápis do logu)
+TRACKING_BATCH_SIZE = int(os.getenv("TRACKING_BATCH_SIZE", "500"))
+# Nejdelší doba (s), po kterou se čeká na doplnění dávky
+TRACKING_FLUSH_INTERVAL = float(os.getenv("TRACKING_FLUSH_INTERVAL", "0.5"))
+# Chování při plné frontě: "block" = počkat nejvýše TRACKING_BLOCK_TIMEOUT s, pak zahodit;
+# "drop" = událost rovnou zahodit
+TRACKING_BACKPRESSURE = os.getenv("TRACKING_BACKPRESSURE", "block")
+TRACKING_BLOCK_TIMEOUT = float(os.getenv("TRACKING_BLOCK_TIMEOUT", "1.0"))
+# Jak dlouho (s) se při ukončení procesu čeká na zapsání zbytku fronty
+TRACKING_SHUTDOWN_TIMEOUT = float(os.getenv("TRACKING_SHUTDOWN_TIMEOUT", "10"))
+# Za kolik sekund se zopakuje zápis dávky po přechodné chybě DB (výpadek spojení)
+TRACKING_RETRY_INTERVAL = float(os.getenv("TRACKING_RETRY_INTERVAL", "1"))
+
+_log_lock = threading.Lock()
+
+@contextmanager
+def _storage_lock(exclusive=True):
+    """
+    Zamkne log i snapshot proti ostatním vláknům a procesům (flock).
+    Zápis a kompakce berou zámek výhradně, čtení sdíleně.
+    """
+    with _log_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(LOCK_PATH, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+_event_queue = None
+_flusher = None
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+dropped_events = 0
+# Události, které DB trvale odmítla (např. uživatel mezitím smazán) a byly zahozeny
+rejected_events = 0
+
+def _utc_timestamp(dt):
+    return dt.isoformat().replace('+00:00', 'Z')
+
+def _now_ms():
+    return time.time_ns() // 1_000_000
+
+def _ms_to_timestamp(ms):
+    return _utc_timestamp(datetime.fromtimestamp(ms / 1000, timezone.utc))
+
+def _timestamp_to_ms(timestamp):
+    return round(datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp() * 1000)
 
-def load_json_data():
+def _encode_fields(action, field_truth_dict):
+    """Převede {pole: bool} na bitovou masku podle ACTION_FIELDS."""
+    return sum(1 << i for i, field in enumerate(ACTION_FIELDS[action]) if field_truth_dict.get(field))
+
+def _decode_fields(action, mask):
+    return {field: bool(mask >> i & 1) for i, field in enumerate(ACTION_FIELDS[action])}
+
+def _validation_failed(action, mask):
+    required = REQUIRED_MASKS[action]
+    return mask & required != required
+
+def _decode_record(record):
+    """Převede kompaktní záznam snapshotu na slovník ve formátu form_data.json."""
+    if isinstance(record, dict):  # záznam ze starého formátu snapshotu
+        return record
+    ms, token, action, submitted, mask = record
+    decoded = {"timestamp": _ms_to_timestamp(ms), "token": token, "action": action}
+    if submitted:
+        decoded.update(submitted=True, validation_failed=_validation_failed(action, mask))
+    else:
+        decoded.update(link_click=True, submitted=False)
+    decoded["data"] = _decode_fields(action, mask)
+    return decoded
+
+def _encode_record(record):
+    """Převede záznam starého formátu snapshotu na kompaktní (neznámé akce ponechá beze změny)."""
+    if not isinstance(record, dict) or record.get("action") not in ACTION_FIELDS:
+        return record
+    submitted = record.get("submitted", False)
+    return [_timestamp_to_ms(record["timestamp"]), record.get("token"), record["action"],
+            1 if submitted else 0, _encode_fields(record["action"], record.get("data", {}))]
+
+def _normalize_event(event):
+    """Převede událost starého formátu logu (slovník, seznam bez kampaně) na kompaktní seznam."""
+    if isinstance(event, list):
+        return event if len(event) == 7 else event + [DEFAULT_CAMPAIGN]
+    campaign = event.get("campaign", DEFAULT_CAMPAIGN)
+    if event["type"] == "link_click":
+        return [CLICK, event["user_id"], _timestamp_to_ms(event["timestamp"]),
+                event["token"], event["action"], 0, campaign]
+    return [SUBMISSION, event["user_id"], _timestamp_to_ms(event["timestamp"]),
+            event["token"], event["action"], _encode_fields(event["action"], event["data"]), campaign]
+
+def _load_snapshot():
+    """Načte snapshot ve tvaru {"campaigns": {kampaň: {user_id: [záznamy]}}, "log_id": ...}."""
+    data = {}
     if os.path.exists(JSON_DB_PATH):
         with open(JSON_DB_PATH, 'r') as f:
-            return json.load(f)
-    return {"users": {}}
+            data = json.load(f)
+    if "campaigns" not in data:
+        # Snapshot z doby před kampaněmi – všechna data patří výchozí kampani
+        users = data.pop("users", {})
+        data["campaigns"] = {DEFAULT_CAMPAIGN: users} if users else {}
+    return data
+
+def _load_campaigns(campaign=None):
+    """
+    Aktuální stav dat v kompaktním tvaru {kampaň: {user_id: [záznamy]}}: poslední snapshot
+    + přehrané události z logu (resp. z databáze). S campaign jen tato kampaň
+    (ostatní kampaně se nepřehrávají).
+    """
+    # Události čekající ve frontě tohoto procesu patří do pohledu také
+    flush_tracking_events()
+    if TRACKING_BACKEND == "database":
+        campaigns = {}
+        open_clicks = {}
+        for row in get_tracking_events(campaign=campaign):
+            _apply_event(campaigns, _row_to_event(row), open_clicks)
+        return campaigns
+
+    # Snapshot a log se čtou pod sdíleným zámkem, aby je mezi tím nepřepsala kompakce
+    with _storage_lock(exclusive=False):
+        data = _load_snapshot()
+        campaigns = data["campaigns"]
+        if campaign is not None:
+            campaigns = {campaign: campaigns[campaign]} if campaign in campaigns else {}
+        _replay_event_log(campaigns, data.get("log_id"), _build_open_click_index(campaigns), campaign)
+    return campaigns
+
+def load_json_data(campaign=None):
+    """
+    Vrátí aktuální stav dat ve formátu form_data.json: {"users": {user_id: [záznamy]}}.
+    S campaign jen z této kampaně, jinak ze všech kampaní dohromady
+    (záznamy uživatele seřazené podle času). Rozdělení podle kampaní vrací load_campaign_data.
+    """
+    campaigns = _load_campaigns(campaign)
+    if campaign is not None:
+        return {"users": _decode_users(campaigns.get(campaign, {}))}
+    users = {}
+    for campaign_users in campaigns.values():
+        for user_id, user_records in _decode_users(campaign_users).items():
+            users.setdefault(user_id, []).extend(user_records)
+    if len(campaigns) > 1:
+        for user_records in users.values():
+            user_records.sort(key=lambda record: _timestamp_to_ms(record["timestamp"]))
+    return {"users": users}
+
+def load_campaign_data():
+    """Vrátí aktuální stav dat rozdělený podle kampaní: {"campaigns": {kampaň: {"users": {...}}}}."""
+    return {
+        "campaigns": {name: {"users": _decode_users(users)} for name, users in _load_campaigns().items()}
+    }
+
+def _decode_users(users):
+    return {
+        user_id: [_decode_record(record) for record in user_records]
+        for user_id, user_records in users.items()
+    }
 
 def save_json_data(data):
-    with open(JSON_DB_PATH, 'w') as f:
-        json.dump(data, f, indent=4)
+    """Atomicky přepíše snapshot (zápis do dočasného souboru + přejmenování)."""
+    tmp_path = JSON_DB_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        # json.dumps používá rychlý kodér v C, json.dump do souboru jen pomalý v Pythonu
+        f.write(json.dumps(data, separators=(',', ':')))
+    os.replace(tmp_path, JSON_DB_PATH)
 
-def initialize_form_data():
-    """Načte ID všech uživatelů z databáze a vytvoří prázdnou strukturu v JSON (pokud neexistuje)."""
-    conn = get_db_connection()
-    if conn:
+def _replay_event_log(campaigns, snapshot_log_id, open_clicks, campaign=None,
+                      campaign_stats=None, stats_log_id=None):
+    """
+    Přehraje události z logu do campaigns (s campaign jen události této kampaně).
+    Pokud log už je obsažen ve snapshotu (shodné log_id v hlavičce), nic nepřehrává.
+    S campaign_stats připočte přehrané události i do čítačů, pokud je ještě
+    neobsahují (log_id logu se liší od stats_log_id). Vrací log_id přehraného logu.
+    """
+    if not os.path.exists(EVENT_LOG_PATH):
+        return None
+    log_id = None
+    with open(EVENT_LOG_PATH, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError as e:
+                # Neúplný poslední řádek po pádu procesu
+                print(f"⚠️ Přeskakuji poškozený záznam v logu událostí: {e}")
+                continue
+            if isinstance(event, dict) and "log_id" in event:
+                log_id = event["log_id"]
+                if log_id == snapshot_log_id:
+                    return log_id
+                if log_id == stats_log_id:
+                    campaign_stats = None
+                continue
+            event = _normalize_event(event)
+            if campaign is None or event[6] == campaign:
+                _apply_event(campaigns, event, open_clicks)
+                if campaign_stats is not None:
+                    _count_event(campaign_stats, event)
+    return log_id
+
+def _build_open_click_index(campaigns):
+    """
+    Sestaví index otevřených (neodeslaných) kliknutí po kampaních:
+    kampaň -> (user_id, token, action) -> zásobník (epoch ms, pozice v seznamu uživatele),
+    nejnovější kliknutí je na vrcholu.
+    """
+    open_clicks = {}
+    for campaign, users in campaigns.items():
+        campaign_clicks = open_clicks[campaign] = {}
+        for user_id, user_records in users.items():
+            for position, record in enumerate(user_records):
+                if isinstance(record, list):
+                    ms, token, action, submitted, _ = record
+                else:
+                    if record.get("submitted", False):
+                        continue
+                    token, action, submitted = record.get("token"), record.get("action"), False
+                    try:
+                        ms = _timestamp_to_ms(record["timestamp"])
+                    except Exception as e:
+                        print(f"Chyba při parsování timestampu: {e}")
+                        continue
+                if not submitted:
+                    campaign_clicks.setdefault((user_id, token, action), []).append((ms, position))
+    return open_clicks
+
+def _apply_event(campaigns, event, open_clicks):
+    """Promítne jednu událost z logu do struktury {kampaň: {user_id: [záznamy]}}."""
+    kind, user_id, ms, token, action, mask, campaign = event
+    user_records = campaigns.setdefault(campaign, {}).setdefault(user_id, [])
+    # Kliknutí se s odesláním páruje jen v rámci stejné kampaně
+    campaign_clicks = open_clicks.setdefault(campaign, {})
+    key = (user_id, token, action)
+
+    if kind == CLICK:
+        campaign_clicks.setdefault(key, []).append((ms, len(user_records)))
+        user_records.append([ms, token, action, 0, 0])
+        return
+
+    # submission – přepíše nejnovější otevřený link_click v 10min okně, nebo přidá nový záznam
+    stack = campaign_clicks.get(key)
+    if stack and abs(ms - stack[-1][0]) <= SUBMISSION_WINDOW_MS:
+        click_ms, position = stack.pop()
+        user_records[position] = [click_ms, token, action, 1, mask]
+        return
+
+    user_records.append([ms, token, action, 1, mask])
+
+def _new_log_header():
+    return json.dumps({"log_id": uuid.uuid4().hex}) + '\n'
+
+def _append_events(events):
+    """Připíše dávku událostí na konec logu; občas log složí do snapshotu."""
+    lines = ''.join(json.dumps(event, ensure_ascii=False, separators=(',', ':')) + '\n' for event in events)
+    with _storage_lock():
+        with open(EVENT_LOG_PATH, 'a', encoding='utf-8') as f:
+            if f.tell() == 0:
+                f.write(_new_log_header())
+            f.write(lines)
+            log_size = f.tell()
+
+        if log_size >= SNAPSHOT_MIN_BYTES:
+            snapshot_size = os.path.getsize(JSON_DB_PATH) if os.path.exists(JSON_DB_PATH) else 0
+            if log_size >= snapshot_size:
+                _compact_event_log()
+
+@contextmanager
+def _gc_paused():
+    """Pozastaví cyklický garbage collector (uvolňování podle počtu referencí běží dál)."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def _compact_event_log():
+    # Snapshot jsou miliony malých seznamů – cyklický GC by je při skládání procházel
+    # opakovaně a cena kompakce by rostla rychleji než velikost dat
+    with _gc_paused():
+        data = _load_snapshot()
+        snapshot_log_id = data.get("log_id")
+        campaigns = data["campaigns"]
+        stats_log_id, stats = _load_stats_base(campaigns, snapshot_log_id)
+        # Log se čte jen jednou – přehrané události se rovnou připočtou i do čítačů
+        log_id = _replay_event_log(campaigns, snapshot_log_id, _build_open_click_index(campaigns),
+                                   campaign_stats=stats, stats_log_id=stats_log_id)
+        if log_id is None:
+            return
+
+        # Čítače se ukládají jako první – pokud už log obsahovaly, nepočítaly se znovu
+        _save_stats(log_id, stats)
+
+        # Snapshot si pamatuje log_id – při pádu před výměnou logu se log nepřehraje dvakrát
+        data["campaigns"] = {
+            campaign: {
+                user_id: [_encode_record(record) for record in user_records]
+                for user_id, user_records in users.items()
+            }
+            for campaign, users in campaigns.items()
+        }
+        data["log_id"] = log_id
+        save_json_data(data)
+
+        tmp_path = EVENT_LOG_PATH + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(_new_log_header())
+        os.replace(tmp_path, EVENT_LOG_PATH)
+
+def compact_event_log():
+    """Složí log událostí do snapshotu (form_data.json) a založí nový prázdný log."""
+    # Události čekající ve frontě tohoto procesu se složí také
+    flush_tracking_events()
+    with _storage_lock():
+        _compact_event_log()
+
+def _new_counter():
+    return {"clicks": 0, "submissions": 0, "validation_failures": 0}
+
+def _new_action_counter():
+    # U akce se navíc počítají uživatelé, kteří na ni klikli (zvyšuje se při jejich prvním kliknutí)
+    return dict(_new_counter(), unique_users=0)
+
+def _new_stats():
+    return {"actions": {}, "users": {}, "hours": {}}
+
+def _bump(counter, is_click, validation_failed):
+    if is_click:
+        counter["clicks"] += 1
+    else:
+        counter["submissions"] += 1
+        if validation_failed:
+            counter["validation_failures"] += 1
+
+def _get_counter(counters, key, new_counter):
+    # Nový čítač se vytváří jen pro chybějící klíč (setdefault by ho vytvářel při každé události)
+    counter = counters.get(key)
+    if counter is None:
+        counter = counters[key] = new_counter()
+    return counter
+
+def _count(stats, user_id, action, hour, is_click, validation_failed):
+    action_counter = _get_counter(stats["actions"], action, _new_action_counter)
+    user_counter = _get_counter(stats["users"].setdefault(user_id, {}), action, _new_counter)
+    hour_counter = _get_counter(stats["hours"].setdefault(hour, {}), action, _new_counter)
+    for counter in (action_counter, user_counter, hour_counter):
+        _bump(counter, is_click, validation_failed)
+    if is_click and user_counter["clicks"] == 1:
+        action_counter["unique_users"] += 1
+
+def _backfill_unique_users(stats):
+    """Dopočítá unique_users u čítačů uložených před jeho zavedením (jednou při načtení)."""
+    for action, counter in stats["actions"].items():
+        if "unique_users" not in counter:
+            counter["unique_users"] = sum(
+                1 for actions in stats["users"].values()
+                if actions.get(action, {}).get("clicks", 0) > 0
+            )
+    return stats
+
+@functools.lru_cache(maxsize=64)
+def _hour_key(hour_number):
+    """Klíč hodinového čítače (UTC) pro číslo hodiny od epochy."""
+    return datetime.fromtimestamp(hour_number * 3600, timezone.utc).strftime('%Y-%m-%dT%H')
+
+def _count_event(campaign_stats, event):
+    """Připočte jednu událost do čítačů její kampaně podle akce, uživatele a hodiny (UTC)."""
+    kind, user_id, ms, _, action, mask, campaign = event
+    hour = _hour_key(ms // 3_600_000)
+    is_click = kind == CLICK
+    _count(campaign_stats.setdefault(campaign, _new_stats()), user_id, action, hour,
+           is_click, not is_click and _validation_failed(action, mask))
+
+def _stats_from_records(campaigns):
+    """
+    Odhadne čítače ze záznamů starého snapshotu (bez uložených čítačů).
+    Každý záznam je kliknutí, odeslaný záznam navíc odeslání formuláře.
+    """
+    campaign_stats = {}
+    for campaign, users in campaigns.items():
+        stats = campaign_stats[campaign] = _new_stats()
+        for user_id, user_records in users.items():
+            for record in map(_decode_record, user_records):
+                action, hour = record.get("action"), record.get("timestamp", "")[:13]
+                _count(stats, user_id, action, hour, True, False)
+                if record.get("submitted", False):
+                    _count(stats, user_id, action, hour, False, record.get("validation_failed"))
+    return campaign_stats
+
+def _load_stats_base(snapshot_campaigns=None, snapshot_log_id=None):
+    """
+    Vrátí (log_id, čítače po kampaních) – čítače zahrnují všechny události až po log
+    s daným log_id. Pokud uložené čítače chybí, odhadnou se jednorázově ze snapshotu.
+    """
+    if os.path.exists(STATS_PATH):
+        with open(STATS_PATH, 'r') as f:
+            saved = json.load(f)
+        # Čítače z doby před kampaněmi patří výchozí kampani
+        campaign_stats = saved["campaigns"] if "campaigns" in saved else {DEFAULT_CAMPAIGN: saved["stats"]}
+        for stats in campaign_stats.values():
+            _backfill_unique_users(stats)
+        return saved["log_id"], campaign_stats
+    if snapshot_campaigns is None:
+        snapshot = _load_snapshot()
+        snapshot_campaigns, snapshot_log_id = snapshot["campaigns"], snapshot.get("log_id")
+    return snapshot_log_id, _stats_from_records(snapshot_campaigns)
+
+def _save_stats(log_id, campaign_stats):
+    tmp_path = STATS_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(json.dumps({"log_id": log_id, "campaigns": campaign_stats}))
+    os.replace(tmp_path, STATS_PATH)
+
+def _read_log_tail(offset, known_log_id):
+    """
+    Přečte z logu kompletní řádky od daného bajtového offsetu. Offset patří logu
+    known_log_id – pokud má log v hlavičce jiné log_id (mezitím ho vyměnila kompakce),
+    čte se od začátku. Vrací (log_id z hlavičky, seznam událostí, nový offset).
+    """
+    if not os.path.exists(EVENT_LOG_PATH):
+        return None, [], 0
+    with open(EVENT_LOG_PATH, 'rb') as f:
+        header = f.readline()
         try:
-            cur = conn.cursor()
-            cur.execute("SELECT id FROM user_data")
-            user_ids = [str(row[0]) for row in cur.fetchall()]
-            cur.close()
-            conn.close()
-        except Exception as e:
-            print(f"Chyba při načítání uživatelů: {e}")
-            user_ids = []
+            log_id = json.loads(header)["log_id"] if header.endswith(b'\n') else None
+        except (json.JSONDecodeError, KeyError):
+            log_id = None
+        if log_id != known_log_id or offset < f.tell():
+            offset = f.tell()
+        f.seek(offset)
+        chunk = f.read()
+
+    events = []
+    complete = chunk[:chunk.rfind(b'\n') + 1]
+    for line in complete.splitlines():
+        if not line.strip():
+            continue
+        try:
+            events.append(_normalize_event(json.loads(line)))
+        except json.JSONDecodeError as e:
+            print(f"⚠️ Přeskakuji poškozený záznam v logu událostí: {e}")
+    return log_id, events, offset + len(complete)
+
+# Čítače po kampaních v tomto procesu: základ z form_stats.json + dočtený konec aktuálního logu
+_stats_cache = {"log_id": None, "offset": 0, "stats": None}
+
+def _current_stats():
+    cache = _stats_cache
+    # Offset z cache platí jen pro stejný log (podle log_id v hlavičce), jinak se čte celý
+    log_id, events, offset = _read_log_tail(
+        cache["offset"], cache["log_id"] if cache["stats"] is not None else None
+    )
+
+    if cache["stats"] is None or log_id != cache["log_id"]:
+        # První volání nebo log mezitím vyměnila kompakce – začneme od uložených čítačů
+        stats_log_id, stats = _load_stats_base()
+        if log_id is not None and log_id == stats_log_id:
+            events = []
+        cache.update(log_id=log_id, stats=stats)
+
+    for event in events:
+        _count_event(cache["stats"], event)
+    cache["offset"] = offset
+    return cache["stats"]
+
+def _actions_from_rows(rows):
+    """Čítače podle akce z řádků get_tracking_counters: {kampaň: {akce: čítač}}."""
+    campaign_actions = {}
+    for campaign, action, clicks, submissions, validation_failures, unique_users in rows:
+        campaign_actions.setdefault(campaign, {})[action] = {
+            "clicks": clicks, "submissions": submissions,
+            "validation_failures": validation_failures, "unique_users": unique_users
+        }
+    return campaign_actions
+
+def _stats_to_rows(events):
+    """
+    Sečte dávku událostí do řádků
+    (campaign, bucket_type, bucket, action, clicks, submissions, validation_failures).
+    """
+    campaign_stats = {}
+    for event in events:
+        _count_event(campaign_stats, event)
+    rows = []
+    for campaign, stats in campaign_stats.items():
+        rows.extend((campaign, "action", "", action, c["clicks"], c["submissions"], c["validation_failures"])
+                    for action, c in stats["actions"].items())
+        for bucket_type in ("user", "hour"):
+            for bucket, actions in stats[bucket_type + "s"].items():
+                rows.extend((campaign, bucket_type, bucket, action,
+                             c["clicks"], c["submissions"], c["validation_failures"])
+                            for action, c in actions.items())
+    return rows
+
+def _add_counter(target, counter):
+    for key, value in counter.items():
+        target[key] += value
+
+def _merge_actions(campaign_actions):
+    """Sečte čítače podle akce více kampaní (nové slovníky, vstup se nemění)."""
+    merged = {}
+    for actions in campaign_actions:
+        for action, counter in actions.items():
+            _add_counter(merged.setdefault(action, _new_action_counter()), counter)
+    return merged
+
+def _ratio(numerator, denominator):
+    return round(numerator / denominator, 4) if denominator else None
+
+def get_stats(campaign=None):
+    """
+    Vrátí agregované čítače podle akce (kliknutí, odeslání, chyby validace,
+    počet uživatelů s kliknutím a poměry). S campaign jen pro danou kampaň, jinak
+    součet přes všechny kampaně se seznamem kampaní – unique_users je pak součet
+    za kampaně (uživatel se počítá v každé kampani, ve které klikl).
+
+    Čtou se jen průběžně udržované čítače, na frontu tohoto procesu se nečeká
+    (události z posledního intervalu flusheru se projeví při dalším volání).
+    Velikost odpovědi nezávisí na počtu uživatelů ani délce kampaně; rozpis podle
+    uživatele a hodiny vrací po stránkách get_stats_breakdown.
+    """
+    if TRACKING_BACKEND == "database":
+        campaign_actions = _actions_from_rows(get_tracking_counters(campaign))
     else:
-        user_ids = []
-
-    data = load_json_data()
-    if "users" not in data:
-        data["users"] = {}
-
-    for user_id in user_ids:
-        if user_id not in data["users"]:
-            data["users"][user_id] = []
-
-    save_json_data(data)
-
-def log_link_click(user_id, token, action, fields):
-    """Zaznamená kliknutí na odkaz, nastaví všechna pole na False."""
-    data = load_json_data()
-    user_id = str(user_id)
-
-    if "users" not in data:
-        data["users"] = {}
-    if user_id not in data["users"]:
-        data["users"][user_id] = []
-
-    now = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
-    record = {
-        "timestamp": now,
-        "token": token,
-        "action": action,
-        "link_click": True,
-        "submitted": False,
-        "data": {field: False for field in fields}
-    }
+        with _storage_lock(exclusive=False):
+            current = _current_stats()
+            campaign_actions = {
+                name: {action: dict(counter) for action, counter in stats["actions"].items()}
+                for name, stats in current.items()
+                if campaign is None or name == campaign
+            }
+
+    if campaign is not None:
+        stats = {"actions": campaign_actions.get(campaign, {}), "campaign": campaign}
+    else:
+        stats = {"actions": _merge_actions(campaign_actions.values()), "campaigns": sorted(campaign_actions)}
+
+    for counter in stats["actions"].values():
+        counter["submit_rate"] = _ratio(counter["submissions"], counter["clicks"])
+        counter["validation_failure_rate"] = _ratio(counter["validation_failures"], counter["submissions"])
+    return stats
+
+# Rozpis čítačů: název v odpovědi -> (bucket_type v tracking_counters, klíč položky)
+STATS_BREAKDOWNS = {"users": ("user", "user_id"), "hours": ("hour", "hour")}
+# Počet bucketů na stránku rozpisu (výchozí a nejvyšší povolený)
+STATS_PAGE_SIZE = int(os.getenv("STATS_PAGE_SIZE", "100"))
+STATS_PAGE_MAX = int(os.getenv("STATS_PAGE_MAX", "1000"))
 
-    data["users"][user_id].append(record)
-    save_json_data(data)
+def get_stats_breakdown(breakdown, campaign=None, offset=0, limit=STATS_PAGE_SIZE):
+    """
+    Stránka rozpisu čítačů podle uživatele (breakdown "users") nebo hodiny ("hours"):
+    {"items": [{"campaign", "user_id" / "hour", "actions": {akce: čítač}}], "offset", "limit",
+    "next_offset"} – next_offset je None na poslední stránce. S campaign jen pro danou
+    kampaň, jinak položky všech kampaní (bez sčítání přes kampaně).
+    """
+    bucket_type, key = STATS_BREAKDOWNS[breakdown]
+    items = []
+    if TRACKING_BACKEND == "database":
+        for row_campaign, bucket, action, clicks, submissions, validation_failures in \
+                get_tracking_buckets(bucket_type, campaign, offset, limit):
+            if not items or items[-1]["campaign"] != row_campaign or items[-1][key] != bucket:
+                items.append({"campaign": row_campaign, key: bucket, "actions": {}})
+            items[-1]["actions"][action] = {
+                "clicks": clicks, "submissions": submissions, "validation_failures": validation_failures
+            }
+    else:
+        with _storage_lock(exclusive=False):
+            current = _current_stats()
+            # Buckety v pořadí vzniku (slovníky se jen rozšiřují), přeskočí se jen offset položek
+            buckets = itertools.chain.from_iterable(
+                ((name, bucket, actions) for bucket, actions in stats[breakdown].items())
+                for name, stats in current.items()
+                if campaign is None or name == campaign
+            )
+            items = [
+                {"campaign": name, key: bucket,
+                 "actions": {action: dict(counter) for action, counter in actions.items()}}
+                for name, bucket, actions in itertools.islice(buckets, offset, offset + limit)
+            ]
+    return {
+        "items": items, "offset": offset, "limit": limit,
+        "next_offset": offset + limit if len(items) == limit else None
+    }
 
-def append_user_submission(user_id, token, action, field_truth_dict):
-    """Přepíše recentní link_click záznam, nebo vytvoří nový záznam jako submitted."""
-    data = load_json_data()
-    user_id = str(user_id)
+def _event_to_row(event):
+    kind, user_id, ms, token, action, mask, campaign = event
+    return (int(user_id), "link_click" if kind == CLICK else "submission", token, action, ms, mask, campaign)
 
-    if "users" not in data:
-        data["users"] = {}
-    if user_id not in data["users"]:
-        data["users"][user_id] = []
+def _row_to_event(row):
+    user_id, event_type, token, action, ms, mask, campaign = row
+    return [CLICK if event_type == "link_click" else SUBMISSION, str(user_id), ms, token, action, mask, campaign]
 
-    now = datetime.now(timezone.utc)
-    updated = False
+def _insert_events(events):
+    """
+    Zapíše dávku událostí do DB. Při nedostupné DB dávku nezahodí, ale zkouší ji
+    zapsat znovu. Trvalou chybu (porušení integrity, neplatná data) opakování
+    nespraví – dávka se půlí, dokud se vadné události neoddělí a nezahodí,
+    ostatní se zapíšou a fronta se dál vyprazdňuje.
+    """
+    global rejected_events
+    while True:
+        try:
+            insert_tracking_events([_event_to_row(event) for event in events], _stats_to_rows(events))
+            return
+        except Exception as e:
+            if is_transient_error(e):
+                print(f"❌ DB není dostupná, zápis {len(events)} událostí zopakuji: {e}")
+                time.sleep(TRACKING_RETRY_INTERVAL)
+                continue
+            if len(events) == 1:
+                rejected_events += 1
+                print(f"❌ Událost nelze zapsat, zahazuji ji (celkem {rejected_events}): {events[0]} – {e}")
+                return
+            break
+    middle = len(events) // 2
+    _insert_events(events[:middle])
+    _insert_events(events[middle:])
 
-    # Vždycky vezmeme pouze required fields
-    required_fields = {k: v for k, v in field_truth_dict.items() if k != "linkedin"}
-    validation_failed = not all(required_fields.values())
+def _write_events(events):
+    """Zapíše dávku událostí do zvoleného úložiště."""
+    if TRACKING_BACKEND == "database":
+        _insert_events(events)
+    else:
+        _append_events(events)
 
-    for record in reversed(data["users"][user_id]):
-        if (
-            record.get("token") == token and
-            record.get("action") == action and
-            not record.get("submitted", False)
-        ):
+def _flusher_loop(event_queue):
+    """Vybírá události z fronty a zapisuje je po dávkách (plná dávka nebo uplynutí intervalu)."""
+    while True:
+        batch = [event_queue.get()]
+        deadline = time.monotonic() + TRACKING_FLUSH_INTERVAL
+        while len(batch) < TRACKING_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
             try:
-                ts = datetime.fromisoformat(record["timestamp"].replace("Z", "+00:00"))
-                if abs(now - ts) <= timedelta(minutes=10):
-                    new_record = {
-                        "timestamp": record["timestamp"],
-                        "token": token,
-                        "action": action,
-                        "submitted": True,
-                        "validation_failed": validation_failed,
-                        "data": field_truth_dict
-                    }
-                    index = data["users"][user_id].index(record)
-                    data["users"][user_id][index] = new_record
-                    updated = True
-                    break
-            except Exception as e:
-                print(f"Chyba při parsování timestampu: {e}")
-
-    if not updated:
-        new_record = {
-            "timestamp": now.isoformat().replace('+00:00', 'Z'),
-            "token": token,
-            "action": action,
-            "submitted": True,
-            "validation_failed": validation_failed,
-            "data": field_truth_dict
-        }
-        data["users"][user_id].append(new_record)
+                batch.append(event_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            _write_events(batch)
+        except Exception as e:
+            print(f"❌ Chyba při zápisu {len(batch)} událostí: {e}")
+        finally:
+            for _ in batch:
+                event_queue.task_done()
+
+def _get_event_queue():
+    """Vrátí frontu událostí; flusher se spouští líně a po forku (více workerů) znovu."""
+    global _event_queue, _flusher, _flusher_pid
+    if _flusher_pid != os.getpid():
+        with _flusher_lock:
+            if _flusher_pid != os.getpid():
+                _event_queue = queue.Queue(maxsize=TRACKING_QUEUE_SIZE)
+                _flusher = threading.Thread(target=_flusher_loop, args=(_event_queue,),
+                                            name="tracking-flusher", daemon=True)
+                _flusher.start()
+                _flusher_pid = os.getpid()
+    return _event_queue
+
+def _record_event(event):
+    """Zařadí událost do fronty pro zápis na pozadí."""
+    global dropped_events
+    event_queue = _get_event_queue()
+    try:
+        if TRACKING_BACKPRESSURE == "drop":
+            event_queue.put_nowait(event)
+        else:
+            event_queue.put(event, timeout=TRACKING_BLOCK_TIMEOUT)
+    except queue.Full:
+        dropped_events += 1
+        print(f"⚠️ Fronta událostí je plná, událost zahozena (celkem {dropped_events}).")
+
+def flush_tracking_events(timeout=TRACKING_SHUTDOWN_TIMEOUT):
+    """Počká, až flusher zapíše všechny události z fronty. Vrací True, pokud se to stihlo."""
+    if _event_queue is None or _flusher_pid != os.getpid():
+        return True
+    deadline = time.monotonic() + timeout
+    while _event_queue.unfinished_tasks:
+        if time.monotonic() >= deadline:
+            print(f"⚠️ Nepodařilo se zapsat {_event_queue.unfinished_tasks} událostí z fronty.")
+            return False
+        time.sleep(0.01)
+    return True
+
+atexit.register(flush_tracking_events)
+
+def _repair_log_tail():
+    """Odřízne neúplný poslední řádek logu po pádu procesu (čte se jen konec souboru)."""
+    if not os.path.exists(EVENT_LOG_PATH):
+        return
+    with open(EVENT_LOG_PATH, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(0, end - 4096)
+            f.seek(start)
+            chunk = f.read(end - start)
+            if end == size and chunk.endswith(b'\n'):
+                return
+            newline = chunk.rfind(b'\n')
+            if newline != -1:
+                end = start + newline + 1
+                break
+            end = start
+        print(f"⚠️ Odstraňuji neúplný konec logu událostí ({size - end} B).")
+        f.truncate(end)
+
+def initialize_form_data():
+    """
+    Připraví úložiště událostí při startu. Doba startu nezávisí na počtu uživatelů ani událostí:
+    struktura uživatele vzniká až s jeho první událostí a nic se nepřehrává ani nepřepisuje.
+    U JSON úložiště se jen uklidí po případném pádu – zbytky nedokončených atomických zápisů
+    a neúplný poslední řádek logu. Snapshot + log (s log_id) se pak přehrají až při čtení.
+    """
+    if TRACKING_BACKEND == "database":
+        initialize_tracking_table()
+        return
+
+    with _storage_lock():
+        for path in (JSON_DB_PATH, EVENT_LOG_PATH, STATS_PATH):
+            if os.path.exists(path + '.tmp'):
+                os.remove(path + '.tmp')
+        _repair_log_tail()
+
+def log_link_click(user_id, token, action, campaign=DEFAULT_CAMPAIGN):
+    """Zaznamená kliknutí na odkaz v dané kampani, všechna pole jsou False (prázdná maska)."""
+    _record_event([CLICK, str(user_id), _now_ms(), token, action, 0, campaign])
 
-    save_json_data(data)
+def append_user_submission(user_id, token, action, field_truth_dict, campaign=DEFAULT_CAMPAIGN):
+    """
+    Zaznamená odeslání formuláře; při přehrání přepíše recentní link_click záznam
+    téže kampaně, nebo vytvoří nový.
+    """
+    _record_event([SUBMISSION, str(user_id), _now_ms(), token, action,
+                   _encode_fields(action, field_truth_dict), campaign])
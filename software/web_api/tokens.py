@@ -0,0 +1,36 @@
+import os
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Salt, se kterým web_api podepisuje registrační tokeny (e-mail účastníka)
+TOKEN_SALT = "email-confirmation-salt"
+# Maximální stáří tokenu v sekundách; prázdné = tokeny nevyprší
+TOKEN_MAX_AGE = int(os.getenv("TOKEN_MAX_AGE")) if os.getenv("TOKEN_MAX_AGE") else None
+
+_serializer = None
+
+def get_serializer():
+    """Sdílený serializer podepsaný SECRET_KEY (vytvoří se jednou na proces)."""
+    global _serializer
+    if _serializer is None:
+        _serializer = URLSafeTimedSerializer(os.getenv("SECRET_KEY"))
+    return _serializer
+
+def generate_token(email):
+    """Vygeneruje podepsaný token obsahující e-mail účastníka."""
+    return get_serializer().dumps(email, salt=TOKEN_SALT)
+
+def verify_token(token):
+    """
+    Ověří podpis tokenu bez přístupu do databáze.
+    Vrátí e-mail z podepsaného obsahu, nebo None pro podvržený, poškozený či prošlý token.
+    """
+    try:
+        email = get_serializer().loads(token, salt=TOKEN_SALT, max_age=TOKEN_MAX_AGE)
+    except SignatureExpired:
+        return None
+    except BadSignature:
+        return None
+    return email if isinstance(email, str) else None
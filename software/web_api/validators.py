@@ -0,0 +1,14 @@
+import re
+
+EMAIL_REGEX = re.compile(r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$')
+
+# Kontrola validního emailu
+def is_valid_email(email):
+    return EMAIL_REGEX.match(email)
+
+# Identifikátor kampaně v URL formuláře (písmena, číslice, "-" a "_")
+CAMPAIGN_REGEX = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# Kontrola identifikátoru kampaně
+def is_valid_campaign(campaign):
+    return CAMPAIGN_REGEX.match(campaign)
@@ -0,0 +1,70 @@
+"""
+ASGI verze registrační stránky (Quart) – stejné chování jako web_api.py,
+přístup do databáze přes database_async (asyncpg) bez blokování vlákna.
+
+Spuštění (ze složky software/web_api):
+    hypercorn web_api_async:app --bind 0.0.0.0:5000
+"""
+import asyncio
+import os
+from quart import Quart, request, render_template
+from dotenv import load_dotenv
+from database import table_exists, initialize_database
+from database_async import register_user, get_pool, close_pool
+from tokens import generate_token
+from pages import INDEX_TEMPLATE, registration_error, precompile_templates
+from assets import register_assets
+
+# Načtení proměnných z .env souboru
+load_dotenv()
+
+app = Quart(__name__, static_url_path='/static', static_folder='static')
+app.secret_key = os.getenv("SECRET_KEY")
+register_assets(app)
+precompile_templates(app, INDEX_TEMPLATE)
+
+@app.before_serving
+async def startup():
+    try:
+        await get_pool()
+        print("✅ Připojení k databázi bylo úspěšné.")
+
+        # 💡 Kontrola a případná inicializace tabulky user_data (jednorázově, mimo event loop)
+        if not await asyncio.to_thread(table_exists, 'user_data'):
+            print("⚠️ Tabulka 'user_data' neexistuje. Inicializuji databázi...")
+            await asyncio.to_thread(initialize_database)
+        else:
+            print("✅ Tabulka 'user_data' existuje.")
+    except Exception as e:
+        print(f"❌ Nepodařilo se připojit k databázi: {e}")
+
+@app.after_serving
+async def shutdown():
+    await close_pool()
+
+@app.route('/', methods=['GET', 'POST'])
+async def index():
+    message = ""
+    message_color = ""
+    if request.method == 'POST':
+        form = await request.form
+        email = form['email']
+        consent = form.get('consent')
+        message, message_color = registration_error(email, consent)
+        if not message:
+            try:
+                token = generate_token(email)
+                if await register_user(email, token) is None:
+                    message = "Email již vložen."
+                    message_color = "red"
+                else:
+                    message = "Váš e-mail byl přidán do databáze."
+                    message_color = "green"
+            except Exception as e:
+                message = f"Chyba při vkládání e-mailu: {e}"
+                message_color = "red"
+
+    return await render_template(INDEX_TEMPLATE, message=message, message_color=message_color)
+
+if __name__ == '__main__':
+    app.run(host="0.0.0.0", port=5000)